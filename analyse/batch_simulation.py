@@ -0,0 +1,202 @@
+import numpy as np
+
+from analyse.predictor import Predictor
+from analyse.purchase_log import PurchaseLog
+from data.thing_table import ThingTable
+
+
+class BatchResult:
+    def __init__(self, names, incomes, log_rollout, log_time, log_income, log_thing, log_cost, log_quantity):
+        self.names = names
+        self.incomes = incomes
+
+        # Purchase events of every rollout, in time order
+        self._log_rollout = log_rollout
+        self._log_time = log_time
+        self._log_income = log_income
+        self._log_thing = log_thing
+        self._log_cost = log_cost
+        self._log_quantity = log_quantity
+
+    @property
+    def purchases(self):
+        # Rollout, time and thing of every purchase
+        return self._log_rollout, self._log_time, self._log_thing
+
+    def log(self, rollout):
+        mask = self._log_rollout == rollout
+
+        return PurchaseLog.records(
+            self.names, self._log_time[mask], self._log_income[mask], self._log_thing[mask],
+            self._log_cost[mask], self._log_quantity[mask]
+        )
+
+
+class BatchSimulation:
+    POTATO_TYPE = ThingTable.POTATO_TYPE
+    PROBETATO = ThingTable.PROBETATO
+    UPGRADE = ThingTable.UPGRADE
+
+    def __init__(self, simulation_things, time_steps, rollouts=1024, seed=None, biases=None):
+        self.time_steps = time_steps
+        self.rollouts = rollouts
+        self.biases = biases
+        self._rng = np.random.default_rng(seed)
+
+        self._compile(simulation_things)
+
+    def _compile(self, simulation_things):
+        table = ThingTable(simulation_things)
+        self.names = table.names
+
+        self._kind = table.kind
+        self._base_power = table.base_power
+        self._target = table.target
+        self._upgrade_multiplier = table.upgrade_multiplier
+        self._buff_duration = table.buff_duration
+        self._buff_value = table.buff_value
+        self._upgrades = table.upgrades
+
+        # Starting state, copied into every rollout
+        self._quantity = table.quantity
+        self._multiplier = table.multiplier
+        self._power = table.power
+        self._cost = table.current_cost
+        self._efficiency = table.efficiency
+        self.income = table.income()
+
+        self._buff_window = int(self._buff_duration.max()) + 1
+
+        # Cost of the next unit for every quantity a rollout can reach
+        max_quantity = int(self._quantity.max()) + self.time_steps + 1
+        self._cost_table = np.zeros((len(table), max_quantity + 1))
+
+        for i, name in enumerate(self.names):
+            if self._kind[i] == self.UPGRADE:
+                self._cost_table[i] = self._cost[i]
+                continue
+
+            self._cost_table[i] = Predictor.cost_table(name, max_quantity + 1)[:max_quantity + 1]
+
+            if self._kind[i] == self.PROBETATO:
+                self._cost_table[i, 3] += 550
+
+    def _effective_power(self, quantity, power):
+        # Probetatos only produce from the third one on
+        return np.where((self._kind == self.PROBETATO) & (quantity < 3), 0, power)
+
+    def _weights(self, quantity, power, cost, efficiency, income):
+        weights = efficiency.copy()
+
+        if len(self._upgrades):
+            target = self._target[self._upgrades]
+            target_power = self._effective_power(quantity, power)[:, target]
+            target_quantity = quantity[:, target]
+            upgrade_power = target_power * self._upgrade_multiplier[self._upgrades] * target_quantity - target_power * target_quantity
+            weights[:, self._upgrades] = upgrade_power / cost[:, self._upgrades]
+
+        buyable = ~((self._kind == self.UPGRADE) & (quantity > 0))
+        mask = buyable & ~(cost / income[:, None] > self.time_steps)
+
+        return np.where(mask, weights, 0)
+
+    def run(self, income_per_second=None):
+        # From the income of the things unless given
+        if income_per_second is None:
+            income_per_second = self.income
+        rollouts = self.rollouts
+        rows = np.arange(rollouts)
+
+        quantity = np.tile(self._quantity, (rollouts, 1))
+        multiplier = np.tile(self._multiplier, (rollouts, 1))
+        power = np.tile(self._power, (rollouts, 1))
+        cost = np.tile(self._cost, (rollouts, 1))
+        efficiency = np.tile(self._efficiency, (rollouts, 1))
+
+        # Pending buff expiries, indexed by time modulo the longest buff
+        pending = np.zeros((rollouts, self._buff_window))
+
+        wallet = np.zeros(rollouts)
+        income = np.full(rollouts, income_per_second or 0.1, dtype=float)
+        last_bought = np.zeros(rollouts, dtype=bool)
+        weights = self._weights(quantity, power, cost, efficiency, income)
+
+        log = [[] for _ in range(6)]
+
+        for t in range(self.time_steps):
+            wallet += income
+            slot = t % self._buff_window
+            income += pending[:, slot]
+            pending[:, slot] = 0
+
+            # Rollouts that bought before recalculate, the others drop what was already affordable
+            affordable_before = cost <= (wallet - income)[:, None]
+            if last_bought.any():
+                fresh = self._weights(quantity, power, cost, efficiency, income)
+                weights = np.where(last_bought[:, None], fresh, np.where(affordable_before, 0, weights))
+            else:
+                weights = np.where(affordable_before, 0, weights)
+
+            # Decide what to buy based on the weights
+            if self.biases is None:
+                cumulative = np.cumsum(weights, axis=1)
+            else:
+                cumulative = np.cumsum(weights * self.biases.table[self.biases.bucket(t)], axis=1)
+            total = cumulative[:, -1]
+            draw = self._rng.random(rollouts) * total
+            selected = np.minimum((cumulative <= draw[:, None]).sum(axis=1), len(self.names) - 1)
+
+            buy = (total > 0) & (cost[rows, selected] <= wallet)
+            if not buy.any():
+                continue
+
+            buyer = np.flatnonzero(buy)
+            thing = selected[buyer]
+            bought_quantity = quantity[buyer, thing]
+            bought_cost = cost[buyer, thing]
+            wallet[buyer] -= bought_cost
+
+            effective_power = self._effective_power(quantity[buyer], power[buyer])
+            gain = effective_power[np.arange(len(buyer)), thing]
+
+            upgrade = self._kind[thing] == self.UPGRADE
+            if upgrade.any():
+                upgrade_row = buyer[upgrade]
+                target = self._target[thing[upgrade]]
+                target_power = effective_power[np.flatnonzero(upgrade), target]
+                target_quantity = quantity[upgrade_row, target]
+                upgrade_multiplier = self._upgrade_multiplier[thing[upgrade]]
+                gain[upgrade] = target_power * upgrade_multiplier * target_quantity - target_power * target_quantity
+
+                quantity[upgrade_row, thing[upgrade]] = 1
+                multiplier[upgrade_row, target] *= upgrade_multiplier
+                power[upgrade_row, target] = self._base_power[target] * multiplier[upgrade_row, target]
+
+            potato = ~upgrade
+            if potato.any():
+                potato_row = buyer[potato]
+                potato_thing = thing[potato]
+                new_quantity = quantity[potato_row, potato_thing] + 1
+                quantity[potato_row, potato_thing] = new_quantity
+                cost[potato_row, potato_thing] = self._cost_table[potato_thing, new_quantity]
+
+                output = power[potato_row, potato_thing]
+                probetato = (self._kind[potato_thing] == self.PROBETATO) & (new_quantity < 3)
+                output = np.where(probetato, self._base_power[potato_thing], output)
+                efficiency[potato_row, potato_thing] = output / cost[potato_row, potato_thing]
+
+            buff_value = self._buff_value[thing]
+            income[buyer] += gain
+            income[buyer] += buff_value
+            has_buff = self._buff_duration[thing] > 0
+            expiry = (t + self._buff_duration[thing[has_buff]]) % self._buff_window
+            pending[buyer[has_buff], expiry] -= buff_value[has_buff]
+
+            last_bought[buyer] = True
+
+            for column, values in zip(log, (buyer, np.full(len(buyer), t), income[buyer], thing, bought_cost, bought_quantity)):
+                column.append(values)
+
+        log = [np.concatenate(column) if column else np.zeros(0) for column in log]
+
+        return BatchResult(self.names, income, *log)
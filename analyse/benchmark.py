@@ -0,0 +1,93 @@
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+from analyse.batch_simulation import BatchSimulation
+from analyse.purchase_log import PurchaseLog
+from analyse.simulation import Simulation
+from managers.thing_maker import ThingMaker
+
+
+class ConcatLog:
+    # The one-row DataFrame concat the rollout loop used to log purchases with
+    def __init__(self):
+        self._log = None
+        self.reset()
+
+    def __len__(self):
+        return len(self._log)
+
+    def reset(self, capacity=None):
+        self._log = pd.DataFrame(columns=PurchaseLog.columns)
+
+    def append(self, time, income, thing, cost, quantity):
+        with warnings.catch_warnings():
+            warnings.simplefilter(action='ignore', category=FutureWarning)
+            self._log = pd.concat([self._log, pd.DataFrame([{
+                "Time": time,
+                "Income": income,
+                "Thing": thing,
+                "Cost": cost,
+                "Quantity": quantity
+            }])], ignore_index=True)
+
+    def to_records(self, names):
+        return self._log.to_dict(orient='records')
+
+
+def make_simulation():
+    thing_maker = ThingMaker()
+    simulation = Simulation(thing_maker, process_count=1, checkpoint_interval=None, sessions=1)
+    thing_maker.shared_memory = simulation.shared_memory
+
+    simulation.thing_maker_starter.start()
+    thing_maker.load_thing_maker()
+    return simulation
+
+
+def benchmark_purchase_log(simulation, time_steps_list, rollouts):
+    for time_steps in time_steps_list:
+        simulation.time_steps = time_steps
+
+        for name, purchase_log in (('pd.concat', ConcatLog()), ('PurchaseLog', PurchaseLog(time_steps))):
+            purchases = 0
+            start = time.perf_counter()
+
+            for _ in range(rollouts):
+                simulation_things = simulation.thing_maker.reset_simulation_things()
+                _, purchase_log = simulation.run_rollout(simulation_things, purchase_log)
+                purchases += len(purchase_log)
+
+            elapsed = time.perf_counter() - start
+            print(f'time_steps={time_steps:<6} {name:<12} {elapsed / rollouts * 1000:9.2f}ms per rollout, '
+                  f'{purchases / rollouts:.0f} purchases')
+
+
+def benchmark_engines(simulation, time_steps_list, rollouts, batch_size=1024):
+    # Rollouts a second of one worker, the step loop against the batch engine
+    for time_steps in time_steps_list:
+        simulation.time_steps = time_steps
+
+        purchase_log = PurchaseLog(time_steps)
+        start = time.perf_counter()
+        for _ in range(rollouts):
+            simulation_things = simulation.thing_maker.reset_simulation_things()
+            _, purchase_log = simulation.run_rollout(simulation_things, purchase_log)
+        step = rollouts / (time.perf_counter() - start)
+
+        simulation_things = simulation.thing_maker.reset_simulation_things()
+        start = time.perf_counter()
+        BatchSimulation(simulation_things, time_steps, batch_size).run()
+        batch = batch_size / (time.perf_counter() - start)
+
+        print(f'time_steps={time_steps:<6} step {step:9.0f} rollouts/s, batch {batch:9.0f} rollouts/s, '
+              f'{batch / step:.1f}x')
+
+
+if __name__ == '__main__':
+    rollouts = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    simulation = make_simulation()
+    benchmark_purchase_log(simulation, [900, 3600, 14400], rollouts)
+    benchmark_engines(simulation, [900, 3600], max(rollouts, 50))
@@ -0,0 +1,118 @@
+from analyse.purchase_model import PurchaseModel
+from analyse.rollout_bound import RolloutBound
+
+
+class BranchAndBound:
+    # Depth-first search over purchase orders, pruned by an optimistic bound on the final income
+    def __init__(self, simulation_things, time_steps, dominance_width=8):
+        self.simulation_things = simulation_things
+        self.model = PurchaseModel(simulation_things, time_steps)
+        self.time_steps = time_steps
+        self.dominance_width = dominance_width
+
+        self._rollout_bound = RolloutBound(simulation_things, time_steps)
+
+        root = self.model.initial_state()
+        self.best_income = self.model.finish(root)
+        self.best_state = root
+        self.nodes = 0
+        self.pruned = 0
+
+        # States reached per quantities vector, to drop the ones reached later with less money
+        self._reached = {}
+        self._stack = [(self.bound(root), root)]
+
+    @property
+    def done(self):
+        return not self._stack
+
+    @property
+    def upper_bound(self):
+        return max([self.best_income] + [bound for bound, _ in self._stack])
+
+    @property
+    def gap(self):
+        upper_bound = self.upper_bound
+        if upper_bound <= 0:
+            return 0
+        return (upper_bound - self.best_income) / upper_bound
+
+    def best_log(self):
+        return self.model.records(self.best_state)
+
+    def search(self, max_nodes=None):
+        expanded = 0
+
+        while self._stack and (max_nodes is None or expanded < max_nodes):
+            bound, state = self._stack.pop()
+            if bound <= self.best_income:
+                self.pruned += 1
+                continue
+
+            expanded += 1
+            self.nodes += 1
+
+            children = []
+            for action in self.model.actions(state, all_buyable=True):
+                child = self.model.step(state, action)
+                if child is None:
+                    continue
+
+                # Every state is also a plan: buy nothing else
+                income = self.model.finish(child)
+                if income > self.best_income:
+                    self.best_income = income
+                    self.best_state = child
+
+                child_bound = self.bound(child)
+                if child_bound <= self.best_income or self._dominated(child):
+                    self.pruned += 1
+                    continue
+
+                children.append((child_bound, child))
+
+            # Most promising child on top of the stack
+            children.sort(key=lambda item: item[0])
+            self._stack.extend(children)
+
+        return self.best_income
+
+    def _dominated(self, state):
+        reached = self._reached.setdefault(state.things_state.quantities, [])
+
+        for other in reached:
+            if self._dominates(other, state):
+                return True
+
+        if len(reached) < self.dominance_width:
+            reached.append(state)
+        return False
+
+    @staticmethod
+    def _dominates(state, other):
+        # Same quantities, earlier, with at least the money and the income of other from other's time on
+        if state.time > other.time:
+            return False
+
+        state = state.copy()
+        state.advance(other.time - state.time)
+        if state.current_w < other.current_w or state.income_per_second < other.income_per_second:
+            return False
+
+        changes = {}
+        for ticks, change in state.buff_manager.schedule():
+            changes[ticks] = changes.get(ticks, 0) + change
+        for ticks, change in other.buff_manager.schedule():
+            changes[ticks] = changes.get(ticks, 0) - change
+
+        difference = state.income_per_second - other.income_per_second
+        for ticks in sorted(changes):
+            difference += changes[ticks]
+            if difference < 0:
+                return False
+
+        return True
+
+    def bound(self, state):
+        state.restore(self.simulation_things)
+        return self._rollout_bound.bound(state.time - 1, state.current_w, state.income_per_second, state.buff_manager)
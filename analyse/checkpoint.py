@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+
+class Checkpoint:
+    # Search state of the running session, written every interval seconds by a thread of its own and replaced
+    # whole so a restart never finds half of one
+    VERSION = 1
+
+    def __init__(self, session, file_path='resource/checkpoint/search.pickle', interval=60):
+        self.session = session
+        self.file_path = file_path
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def fingerprint(things):
+        # Same things, quantities and costs, the search of one is valid for the other
+        state = [(type(thing).__name__, thing.name, thing.quantity, float(thing.current_cost)) for thing in things]
+        return hashlib.sha256(json.dumps(state).encode()).hexdigest()
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Checkpoint not written: {e}")
+
+    def capture(self):
+        configuration = self.session.configuration
+        if configuration is None:
+            return None
+
+        shared_memory = self.session.shared_memory
+        state = shared_memory.snapshot()
+        # Nothing worth keeping, don't replace an older checkpoint with it
+        if not state["simulation_index"]:
+            return None
+
+        state["version"] = self.VERSION
+        state["fingerprint"] = self.fingerprint(shared_memory.catalog)
+        state["configuration"] = {name: configuration[name] for name in
+                                  ("start_income", "time_steps", "engine", "planner", "adaptive")}
+        return state
+
+    def write(self):
+        state = self.capture()
+        if state is None:
+            return False
+
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temporary = self.file_path + '.tmp'
+        with open(temporary, 'wb') as file:
+            pickle.dump(state, file)
+        os.replace(temporary, self.file_path)
+        return True
+
+    def load(self):
+        try:
+            with open(self.file_path, 'rb') as file:
+                state = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+        return state if state.get("version") == self.VERSION else None
+
+    def resume(self):
+        # Counters, best plan and learned biases of the last checkpoint, only if it searched the same things for the
+        # same start income and time steps. Only while the workers are paused
+        state = self.load()
+        if state is None:
+            return False
+
+        shared_memory = self.session.shared_memory
+        configuration = state["configuration"]
+        if (state["fingerprint"] != self.fingerprint(shared_memory.catalog)
+                or configuration["start_income"] != self.session.start_income
+                or configuration["time_steps"] != self.session.time_steps):
+            print("Checkpoint is of another search, starting over")
+            return False
+
+        shared_memory.restore(state)
+        print(f"Resumed after {state['simulation_index']} rollouts with a best income of {state['best'][0]}")
+        return True
@@ -0,0 +1,98 @@
+import time
+
+from analyse.purchase_model import PurchaseModel
+
+
+class NextPurchase:
+    # Thing to buy now, anytime: the greedy payback choice right away, then the first purchases of the greedy order
+    # searched breadth wide and deeper while there is time, every plan finished with greedy purchases
+    def __init__(self, simulation_things, time_steps, breadth=4, max_depth=8):
+        self.model = PurchaseModel(simulation_things, time_steps)
+        self.breadth = breadth
+        self.max_depth = max_depth
+        # Taken before any plan changes the things
+        self.initial_state = self.model.initial_state()
+
+        # Best final income and plans finished of every first purchase
+        self._incomes = {}
+        self._visits = {}
+
+    def greedy(self, state, limit=None):
+        # Buyable things by the seconds to afford them plus the seconds to pay them back, fastest first
+        state.restore(self.model.simulation_things)
+
+        ranked = []
+        for i, thing in enumerate(self.model.simulation_things):
+            if not thing.buyable or thing.efficiency <= 0:
+                continue
+
+            wait = max(thing.current_cost - state.current_w, 0) / state.income_per_second
+            if state.time + wait <= self.model.time_steps:
+                ranked.append((wait + 1 / thing.efficiency, i))
+
+        return [i for _, i in sorted(ranked)][:limit]
+
+    def play_out(self, state):
+        # Final income buying the greedy choice until nothing else can be bought before the horizon
+        while True:
+            for i in self.greedy(state):
+                next_state = self.model.step(state, i)
+                if next_state is not None:
+                    state = next_state
+                    break
+            else:
+                return self.model.finish(state)
+
+    def _search(self, state, depth, deadline, first=None):
+        # Whether every plan depth purchases deep was finished before the deadline
+        if depth == 0:
+            income = self.play_out(state)
+            self._incomes[first] = max(self._incomes.get(first, 0), income)
+            self._visits[first] = self._visits.get(first, 0) + 1
+            return True
+
+        for i in self.greedy(state, self.breadth):
+            if time.monotonic() >= deadline:
+                return False
+
+            next_state = self.model.step(state, i)
+            if next_state is not None and not self._search(next_state, depth - 1, deadline, i if first is None else first):
+                return False
+
+        return True
+
+    def suggest(self, deadline):
+        # Best first purchase found before deadline, a time.monotonic() value, None if nothing can be bought
+        candidates = self.greedy(self.initial_state)
+        if not candidates:
+            return None
+
+        depth = 0
+        while depth < self.max_depth and self._search(self.initial_state, depth + 1, deadline):
+            depth += 1
+
+        if not self._incomes:
+            index, income, visits, confidence, source = candidates[0], None, 0, None, "greedy"
+        else:
+            ranked = sorted(self._incomes, key=self._incomes.get, reverse=True)
+            index, income, visits, source = ranked[0], self._incomes[ranked[0]], self._visits[ranked[0]], "lookahead"
+            # How much better than the next best first purchase, unknown before a second one was scored unless
+            # nothing else can be bought
+            if len(candidates) == 1:
+                confidence = 1.0
+            elif len(ranked) == 1 or income <= 0:
+                confidence = None
+            else:
+                confidence = (income - self._incomes[ranked[1]]) / income
+
+        self.initial_state.restore(self.model.simulation_things)
+        thing = self.model.simulation_things[index]
+        return {
+            "thing": thing.name,
+            "cost": thing.current_cost,
+            "income": income,
+            "source": source,
+            "visits": visits,
+            "confidence": confidence,
+            "depth": depth
+        }
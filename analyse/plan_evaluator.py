@@ -0,0 +1,52 @@
+from analyse.purchase_model import PurchaseModel
+
+
+class PlanEvaluator:
+    # Scores given purchase orders with the purchase model. Plans are walked in sorted order keeping the states along
+    # the last one, so a start shared by several plans is only simulated once
+    def __init__(self, simulation_things, time_steps):
+        self.model = PurchaseModel(simulation_things, time_steps)
+        # Taken before any plan changes the things
+        self.initial_state = self.model.initial_state()
+
+    @staticmethod
+    def sort_key(plan):
+        return [(index, -1 if at is None else at) for index, at in plan]
+
+    def evaluate(self, plans, log=True):
+        # Plans of (thing index, not before second or None), results in the same order. A plan stops at the first
+        # purchase that can't be made before the horizon
+        results = [None] * len(plans)
+
+        path = []
+        # State after the purchases of path that could be made, and how many that were
+        states = [(self.initial_state, 0)]
+        for i in sorted(range(len(plans)), key=lambda i: self.sort_key(plans[i])):
+            plan = plans[i]
+
+            common = 0
+            while common < min(len(path), len(plan)) and path[common] == plan[common]:
+                common += 1
+            del path[common:]
+            del states[common + 1:]
+
+            for purchase in plan[common:]:
+                state, bought = states[-1]
+                if bought == len(path):
+                    next_state = self.model.step(state, *purchase)
+                    if next_state is not None:
+                        state, bought = next_state, bought + 1
+
+                path.append(purchase)
+                states.append((state, bought))
+
+            state, bought = states[-1]
+            results[i] = {
+                "income": self.model.finish(state),
+                "purchases": bought,
+                "complete": bought == len(plan)
+            }
+            if log:
+                results[i]["log"] = self.model.records(state)
+
+        return results
@@ -1,29 +1,47 @@
-import json
+import csv
+import os
 
 import numpy as np
-import pandas as pd
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
+
+from analyse.price_fit import PriceFit
+from analyse.price_store import PriceStore
 
 
 class Predictor:
     json_file_path = 'thing_price_evolution.json'
     _predict_parameters_file_name = 'resource/predict/fitted_parameters.csv'  # File to save the parameters
     _predict_parameters = None
+    _thing_parameters = None
+
+    # Prices added since the history file was last rewritten, refitted in the background
+    _price_log_file_name = 'resource/predict/price_log.jsonl'
+    _price_store = None
+    # Called without arguments after the parameters changed
+    parameter_listeners = []
+
+    # Predicted cost of every thing for quantities 1..len, grown on demand
+    _cost_tables = {}
 
     # Define the exponential function
     @staticmethod
     def __exponential_func(x, a, b):
         return a * b ** x
 
+    # pandas, scipy and matplotlib are only imported to fit and plot, predicting needs none of them
     @staticmethod
     def write_csv(file_name, data):
-        # Create a DataFrame from the dictionary and write to CSV
-        df = pd.DataFrame(data)
-        df.to_csv(file_name, index=False)
+        # Columns of the dictionary side by side, replacing the file whole so it's never read half written
+        temporary = file_name + '.tmp'
+        with open(temporary, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(data.keys())
+            writer.writerows(zip(*data.values()))
+        os.replace(temporary, file_name)
 
     @staticmethod
     def __plot_function(df, output_data, x_values):
+        import matplotlib.pyplot as plt
+
         for column in df.columns:
             if column != 'x' and column + ' Original y' in output_data.keys():
                 y_values = df[column].values
@@ -49,6 +67,8 @@ class Predictor:
     # Fit the exponential model and return the fitted values
     @classmethod
     def __fit_exponential_curve(cls, x_values, y_values):
+        from scipy.optimize import curve_fit
+
         params, _ = curve_fit(Predictor.__exponential_func, x_values, y_values)
         a, b = params
         y_fitted = cls.__exponential_func(np.array(x_values), a, b)
@@ -57,9 +77,10 @@ class Predictor:
     # Main function
     @classmethod
     def generate_parameters(cls, plot=False):
-        # Read JSON data from a file
-        with open(cls.json_file_path, 'r') as file:
-            json_data = json.load(file)
+        import pandas as pd
+
+        # Prices from the history file and the log
+        json_data = cls.get_price_store().history
 
         # Convert lists to pandas Series to handle different lengths
         df = pd.DataFrame(dict([(k, pd.Series(v)) for k, v in json_data.items()]))
@@ -91,7 +112,9 @@ class Predictor:
                 if sum(~np.isnan(df[column])) > 1:
                     y_fitted, a, b = cls.__fit_exponential_curve(x_values_filtered, y_values)
                 else:
-                    a = y_values[0] * 0.85
+                    fit = PriceFit()
+                    fit.add(x_values_filtered[0], y_values[0])
+                    a, b = fit.parameters
                     y_fitted = y_values
 
                 # Add fitted values to the output data
@@ -109,6 +132,8 @@ class Predictor:
         # Write the predict_parameters to a CSV file
         Predictor.write_csv(cls._predict_parameters_file_name, predict_parameters)
         cls._predict_parameters = predict_parameters
+        cls._thing_parameters = None
+        cls._cost_tables = {}
 
         # Plot the results
         if plot:
@@ -117,56 +142,161 @@ class Predictor:
     @classmethod
     def get_predict_parameters(cls):
         if cls._predict_parameters is None:
-            cls._predict_parameters = pd.read_csv(cls._predict_parameters_file_name)
-
-            if isinstance(cls._predict_parameters, dict):
-                cls._predict_parameters = pd.DataFrame(cls._predict_parameters)
+            predict_parameters = {'Column': [], 'a': [], 'b': []}
+            with open(cls._predict_parameters_file_name, 'r', newline='') as file:
+                for row in csv.DictReader(file):
+                    predict_parameters['Column'].append(row['Column'])
+                    # Empty like pandas reads them, as nan
+                    predict_parameters['a'].append(float(row['a'] or 'nan'))
+                    predict_parameters['b'].append(float(row['b'] or 'nan'))
+            cls._predict_parameters = predict_parameters
 
         return cls._predict_parameters
 
+    @classmethod
+    def reload_parameters(cls):
+        # Parameters fitted by another process, read again on the next prediction
+        cls._predict_parameters = None
+        cls._thing_parameters = None
+        cls._cost_tables = {}
+
+    @classmethod
+    def get_thing_parameters(cls, thing):
+        if cls._thing_parameters is None:
+            parameters = cls.get_predict_parameters()
+            cls._thing_parameters = {
+                column: (float(a), float(b)) for column, a, b in zip(parameters['Column'], parameters['a'], parameters['b'])
+            }
+
+        return cls._thing_parameters.get(thing)
+
+    @classmethod
+    def cost_table(cls, thing, size):
+        parameters = cls.get_thing_parameters(thing)
+        if parameters is None:
+            return None
+
+        table = cls._cost_tables.get(thing)
+        if table is None or len(table) < size:
+            # Double the table so a rollout buying one more never recomputes it
+            length = max(size, 2 * len(table) if table is not None else 64)
+            with np.errstate(over='ignore'):
+                table = np.round(cls.__exponential_func(np.arange(1, length + 1), *parameters))
+            cls._cost_tables[thing] = table
+
+        return table
+
     # Method to read parameters and make predictions
     @classmethod
     def predict_thing_cost(cls, value, thing):
-        # Read the parameters from the CSV file
-        df = cls.get_predict_parameters()
+        parameters = cls.get_thing_parameters(thing)
+        if parameters is None:
+            return None
 
-        if isinstance(df, dict):
-            cls._predict_parameters = pd.DataFrame(df)
-            df = cls._predict_parameters
+        # Arrays of quantities are predicted all at once
+        if np.ndim(value):
+            values = np.asarray(value)
+            if np.issubdtype(values.dtype, np.integer) and values.size and values.min() >= 1:
+                return cls.cost_table(thing, int(values.max()))[values - 1]
 
-        # Iterate over each row in the dataframe
-        for _, row in df.iterrows():
-            if row['Column'] != thing:
-                continue
+            with np.errstate(over='ignore'):
+                return np.round(cls.__exponential_func(values, *parameters))
+
+        if isinstance(value, (int, np.integer)) and value >= 1:
+            cost = cls.cost_table(thing, value)[value - 1]
+            return int(cost) if np.isfinite(cost) else float(cost)
 
-            a = row['a']
-            b = row['b']
+        # Predict y values using the exponential function
+        return round(cls.__exponential_func(value, *parameters))
+
+    @classmethod
+    def predict_bulk_cost(cls, value, count, thing):
+        # Cost of count more starting at quantity value, the geometric sum of a * b ** x before rounding
+        parameters = cls.get_thing_parameters(thing)
+        if parameters is None:
+            return None
 
-            # Predict y values using the exponential function
-            return round(cls.__exponential_func(value, a, b))
+        a, b = parameters
+        if count <= 0:
+            return 0.0
+        if b == 1:
+            return a * count
 
-        return None
+        return a * b ** value * (b ** count - 1) / (b - 1)
 
     @classmethod
-    def add_price_evolution(cls, thing, price):
-        with open(cls.json_file_path, 'r') as file:
-            json_data = json.load(file)
+    def get_price_store(cls):
+        if cls._price_store is None:
+            cls._price_store = PriceStore(cls.json_file_path, cls._price_log_file_name, on_refit=cls.__refit)
+        return cls._price_store
 
-        if thing not in json_data:
-            json_data[thing] = []
+    @classmethod
+    def get_price_fits(cls):
+        return cls.get_price_store().fits
 
-        json_data[thing].append(int(price))
+    @classmethod
+    def __refit(cls, parameters):
+        cls.set_parameters(parameters)
+        for thing, (a, b) in parameters.items():
+            print(f'{thing}: y = {a:.2f} * {b:.2f}^x')
+
+    @classmethod
+    def set_parameters(cls, parameters):
+        # Replace the a and b of the things given, save them all and tell the listeners
+        predict_parameters = cls.get_predict_parameters()
+        for thing, (a, b) in parameters.items():
+            if thing in predict_parameters['Column']:
+                i = predict_parameters['Column'].index(thing)
+                predict_parameters['a'][i] = a
+                predict_parameters['b'][i] = b
+            else:
+                predict_parameters['Column'].append(thing)
+                predict_parameters['a'].append(a)
+                predict_parameters['b'].append(b)
 
-        with open(cls.json_file_path, 'w') as file:
-            json.dump(json_data, file, indent=2)
+            if cls._thing_parameters is not None:
+                cls._thing_parameters[thing] = float(a), float(b)
+            cls._cost_tables.pop(thing, None)
 
-        Predictor.generate_parameters()
+        Predictor.write_csv(cls._predict_parameters_file_name, predict_parameters)
+        for listener in cls.parameter_listeners:
+            listener()
 
     @classmethod
-    def get_thing_price(cls):
-        with open(cls.json_file_path, 'r') as file:
-            json_data = json.load(file)
+    def refine_parameters(cls, thing=None):
+        # Nonlinear least squares on the prices themselves, starting from the log-linear fit, only when asked for
+        from scipy.optimize import curve_fit
+
+        history = cls.get_price_store().history
+        fits = cls.get_price_fits()
+
+        parameters = {}
+        for column in [thing] if thing is not None else list(fits):
+            points = [(PriceStore.price_x(history, i), price) for i, price in enumerate(history.get(column, []))
+                      if price is not None]
+            if len(points) < 2:
+                continue
 
+            x_values, y_values = zip(*points)
+            (a, b), _ = curve_fit(Predictor.__exponential_func, x_values, y_values, p0=fits[column].parameters)
+            parameters[column] = a, b
+            print(f'{column}: y = {a:.2f} * {b:.2f}^x')
+
+        if parameters:
+            cls.set_parameters(parameters)
+
+    @classmethod
+    def add_prices(cls, observations):
+        # (thing, quantity, price) tuples, refitted in the background
+        cls.get_price_store().add(observations)
+
+    @classmethod
+    def add_price_evolution(cls, thing, price):
+        cls.add_prices([(thing, None, int(price))])
+
+    @classmethod
+    def get_thing_price(cls):
+        json_data = cls.get_price_store().history
         json_data['columns'] = list(json_data.keys())
 
         return json_data
@@ -0,0 +1,46 @@
+import math
+
+
+class PriceFit:
+    # Least squares fit of log(y) = log(a) + x * log(b) from running sums, one price at a time
+    SINGLE_PRICE_RATIO = 0.85
+
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_xx = 0.0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+
+        # Only point while there is a single one
+        self.first = None
+
+    def add(self, x, price):
+        if price is None or price <= 0:
+            return
+
+        y = math.log(price)
+        self.count += 1
+        self.sum_x += x
+        self.sum_xx += x * x
+        self.sum_y += y
+        self.sum_xy += x * y
+
+        if self.first is None:
+            self.first = x, price
+
+    @property
+    def parameters(self):
+        if self.count == 0:
+            return None
+
+        denominator = self.count * self.sum_xx - self.sum_x ** 2
+        if self.count == 1 or denominator <= 0:
+            # A single price: every next one costs 1 / SINGLE_PRICE_RATIO more, going through the price
+            x, price = self.first
+            b = 1 / self.SINGLE_PRICE_RATIO
+            return price / b ** x, b
+
+        slope = (self.count * self.sum_xy - self.sum_x * self.sum_y) / denominator
+        intercept = (self.sum_y - slope * self.sum_x) / self.count
+        return math.exp(intercept), math.exp(slope)
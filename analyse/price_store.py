@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+
+from analyse.price_fit import PriceFit
+
+
+class PriceStore:
+    # Price history of every thing kept in memory. New prices are appended to a log, merged into the history file
+    # every compact_every prices, and refitted debounce seconds after the last batch
+    def __init__(self, json_file_path, log_file_path, debounce=1.0, compact_every=1000, on_refit=None):
+        self.json_file_path = json_file_path
+        self.log_file_path = log_file_path
+        self.debounce = debounce
+        self.compact_every = compact_every
+        self.on_refit = on_refit
+
+        self._lock = threading.Lock()
+        self._history = None
+        self._fits = None
+        self._logged = 0
+
+        # Things with prices since the last refit
+        self._changed = set()
+        self._timer = None
+
+    @property
+    def history(self):
+        # Copy of the prices of every thing, indexed by quantity - 1
+        with self._lock:
+            self._load()
+            return {thing: list(prices) for thing, prices in self._history.items()}
+
+    @property
+    def fits(self):
+        with self._lock:
+            self._load()
+            return self._fits
+
+    @staticmethod
+    def price_x(history, i):
+        # x of the i-th price of a thing, its position unless the prices come with an x column
+        x_values = history.get('x')
+        return x_values[i] if x_values is not None else i + 1
+
+    def _load(self):
+        if self._history is not None:
+            return
+
+        try:
+            with open(self.json_file_path, 'r') as file:
+                self._history = json.load(file)
+        except FileNotFoundError:
+            self._history = {}
+
+        # Prices logged since the last compaction, their quantity is always set so they can be replayed
+        self._logged = 0
+        try:
+            with open(self.log_file_path, 'r') as file:
+                for line in file:
+                    if line.strip():
+                        observation = json.loads(line)
+                        self._set(observation['thing'], observation['quantity'], observation['price'])
+                        self._logged += 1
+        except FileNotFoundError:
+            pass
+
+        self._fits = {thing: self._fit(thing) for thing in self._history if thing != 'x'}
+
+    def _fit(self, thing):
+        fit = PriceFit()
+        for i, price in enumerate(self._history[thing]):
+            fit.add(self.price_x(self._history, i), price)
+        return fit
+
+    def _set(self, thing, quantity, price):
+        # Whether it replaced a known price
+        prices = self._history.setdefault(thing, [])
+        if quantity > len(prices):
+            prices.extend([None] * (quantity - len(prices)))
+
+        replaced = prices[quantity - 1] is not None
+        prices[quantity - 1] = price
+        return replaced
+
+    def add(self, observations):
+        # (thing, quantity, price) tuples, without a quantity the price is of the one after the last known
+        with self._lock:
+            self._load()
+
+            lines = []
+            for thing, quantity, price in observations:
+                if quantity is None:
+                    quantity = len(self._history.get(thing, [])) + 1
+
+                replaced = self._set(thing, quantity, price)
+                if replaced or thing not in self._fits:
+                    self._fits[thing] = self._fit(thing)
+                else:
+                    self._fits[thing].add(self.price_x(self._history, quantity - 1), price)
+
+                self._changed.add(thing)
+                lines.append(json.dumps({"thing": thing, "quantity": quantity, "price": price}) + "\n")
+
+            with open(self.log_file_path, 'a') as file:
+                file.writelines(lines)
+            self._logged += len(lines)
+
+            # Every batch pushes the refit back
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self.refit)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def refit(self):
+        with self._lock:
+            self._timer = None
+            changed = {thing: self._fits[thing].parameters for thing in self._changed}
+            self._changed = set()
+
+            if self._logged >= self.compact_every:
+                self._compact()
+
+        changed = {thing: parameters for thing, parameters in changed.items() if parameters is not None}
+        if changed and self.on_refit is not None:
+            self.on_refit(changed)
+
+    def compact(self):
+        with self._lock:
+            self._load()
+            self._compact()
+
+    def _compact(self):
+        # Replaced whole so the history file is never half written, the log is only emptied after
+        temporary = self.json_file_path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self._history, file, indent=2)
+        os.replace(temporary, self.json_file_path)
+
+        open(self.log_file_path, 'w').close()
+        self._logged = 0
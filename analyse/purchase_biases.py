@@ -0,0 +1,122 @@
+import heapq
+import math
+
+import numpy as np
+
+
+class PurchaseBiases:
+    # Per thing and time bucket factors multiplying the rollout efficiency weights
+    def __init__(self, thing_count, time_steps, time_buckets=1, table=None):
+        self.thing_count = thing_count
+        self.time_steps = time_steps
+        self.time_buckets = time_buckets
+        self.bucket_size = math.ceil(time_steps / time_buckets)
+
+        if table is None:
+            table = np.ones((time_buckets, thing_count))
+        self.table = np.asarray(table, dtype=float)
+        self._rows = self.table.tolist()
+
+    def bucket(self, t):
+        return min(t // self.bucket_size, self.time_buckets - 1)
+
+    def row(self, t):
+        return self._rows[self.bucket(t)]
+
+    def next_change(self, t):
+        # First second of the next bucket, None in the last one
+        bucket = self.bucket(t)
+        if bucket == self.time_buckets - 1:
+            return None
+        return (bucket + 1) * self.bucket_size
+
+    def counts(self, time, thing):
+        # Purchases of a rollout per bucket and thing
+        buckets = np.minimum(np.asarray(time) // self.bucket_size, self.time_buckets - 1)
+        index = buckets * self.thing_count + np.asarray(thing)
+        return np.bincount(index, minlength=self.time_buckets * self.thing_count)
+
+    def to_dict(self, names):
+        return {name: self.table[:, i].tolist() for i, name in enumerate(names)}
+
+
+class EliteCollector:
+    # Purchase counts of every rollout and the ones of the best elite_fraction, until taken
+    def __init__(self, biases, elite_fraction=0.05):
+        self.biases = biases
+        self.elite_fraction = elite_fraction
+        self.clear()
+
+    def clear(self):
+        self.rollouts = 0
+        self.population = np.zeros(self.biases.time_buckets * self.biases.thing_count)
+        self._elites = []
+
+    def add(self, income, time, thing):
+        counts = self.biases.counts(time, thing)
+        self.rollouts += 1
+        self.population += counts
+
+        # Min heap of the best rollouts, the counter breaks income ties
+        elite = (income, self.rollouts, counts)
+        if len(self._elites) < max(math.ceil(self.elite_fraction * self.rollouts), 1):
+            heapq.heappush(self._elites, elite)
+        elif income > self._elites[0][0]:
+            heapq.heapreplace(self._elites, elite)
+
+    def add_batch(self, incomes, log_rollout, log_time, log_thing):
+        size = self.biases.time_buckets * self.biases.thing_count
+        buckets = np.minimum(log_time.astype(np.int64) // self.biases.bucket_size, self.biases.time_buckets - 1)
+        index = log_rollout.astype(np.int64) * size + buckets * self.biases.thing_count + log_thing.astype(np.int64)
+        counts = np.bincount(index, minlength=len(incomes) * size).reshape(len(incomes), size)
+
+        start = self.rollouts
+        self.rollouts += len(incomes)
+        self.population += counts.sum(axis=0)
+
+        for rollout in np.argsort(incomes)[::-1][:max(math.ceil(self.elite_fraction * len(incomes)), 1)]:
+            heapq.heappush(self._elites, (float(incomes[rollout]), start + int(rollout), counts[rollout]))
+
+        while len(self._elites) > max(math.ceil(self.elite_fraction * self.rollouts), 1):
+            heapq.heappop(self._elites)
+
+    def take(self):
+        # Picklable summary for the coordinator
+        submission = self.rollouts, self.population.tolist(), [(income, counts.tolist()) for income, _, counts in self._elites]
+        self.clear()
+        return submission
+
+
+class CrossEntropyBiases:
+    # Moves the biases toward how much more often the elite rollouts bought each thing than all of them
+    def __init__(self, biases, elite_fraction=0.05, smoothing=0.3, limits=(0.05, 20), generation=0):
+        self.biases = biases
+        self.elite_fraction = elite_fraction
+        self.smoothing = smoothing
+        self.limits = limits
+        # Carries on from the generation the biases were published with
+        self.generation = generation
+
+    def update(self, submissions):
+        rollouts = sum(submission[0] for submission in submissions)
+        if rollouts == 0:
+            return None
+
+        population = np.sum([submission[1] for submission in submissions], axis=0) / rollouts
+
+        # Elite of all the workers' rollouts, every worker sent at least its own share
+        elites = [elite for submission in submissions for elite in submission[2]]
+        elites.sort(key=lambda elite: elite[0], reverse=True)
+        elites = elites[:max(math.ceil(self.elite_fraction * rollouts), 1)]
+        elite = np.mean([counts for _, counts in elites], axis=0)
+
+        # Purchase frequencies are small numbers, a rollout's worth of smoothing keeps rare things from jumping
+        epsilon = 1 / rollouts
+        ratio = ((elite + epsilon) / (population + epsilon)).reshape(self.biases.table.shape)
+
+        table = (1 - self.smoothing) * self.biases.table + self.smoothing * self.biases.table * ratio
+        table = np.clip(table / table.mean(axis=1, keepdims=True), *self.limits)
+
+        self.generation += 1
+        self.biases = PurchaseBiases(self.biases.thing_count, self.biases.time_steps, self.biases.time_buckets, table)
+        return self.biases
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class PurchaseLog:
+    columns = ["Time", "Income", "Thing", "Cost", "Quantity"]
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self._time = np.zeros(capacity, dtype=np.int32)
+        self._income = np.zeros(capacity, dtype=np.float64)
+        self._thing = np.zeros(capacity, dtype=np.int32)
+        self._cost = np.zeros(capacity, dtype=np.int64)
+        self._quantity = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._time)
+
+    @property
+    def time(self):
+        return self._time[:self._size]
+
+    @property
+    def thing(self):
+        return self._thing[:self._size]
+
+    def reset(self, capacity=None):
+        # Keep the arrays, a rollout can never buy more than once per second
+        self._size = 0
+        if capacity is not None and capacity > self.capacity:
+            self._allocate(capacity)
+
+    def append(self, time, income, thing, cost, quantity):
+        if self._size == self.capacity:
+            self._grow()
+
+        i = self._size
+        self._time[i] = time
+        self._income[i] = income
+        self._thing[i] = thing
+        self._cost[i] = cost
+        self._quantity[i] = quantity
+        self._size += 1
+
+    def _grow(self):
+        size = self._size
+        old = self._time, self._income, self._thing, self._cost, self._quantity
+        self._allocate(max(2 * self.capacity, 1))
+        for new, values in zip((self._time, self._income, self._thing, self._cost, self._quantity), old):
+            new[:size] = values[:size]
+
+    def to_records(self, names):
+        size = self._size
+        return self.records(names, self._time[:size], self._income[:size], self._thing[:size], self._cost[:size], self._quantity[:size])
+
+    def to_dataframe(self, names):
+        import pandas as pd
+
+        return pd.DataFrame(self.to_records(names), columns=self.columns)
+
+    @staticmethod
+    def records(names, time, income, thing, cost, quantity):
+        return [{
+            "Time": int(t),
+            "Income": float(i),
+            "Thing": names[int(n)],
+            "Cost": int(c),
+            "Quantity": int(q)
+        } for t, i, n, c, q in zip(time.tolist(), income.tolist(), thing.tolist(), cost.tolist(), quantity.tolist())]
@@ -0,0 +1,155 @@
+import math
+
+from analyse.purchase_log import PurchaseLog
+from analyse.purchase_weights import PurchaseWeights
+from data.simulation_state import SimulationState
+from managers.buff_manager import BuffManager
+from managers.thing_maker import ThingMaker
+
+
+class PlanState:
+    # A rollout frozen at the start of second `time`, with the purchases that led to it
+    def __init__(self, things_state, time, current_w, income_per_second, buff_manager, log):
+        self.things_state = things_state
+        self.time = time
+        self.current_w = current_w
+        self.income_per_second = income_per_second
+        self.buff_manager = buff_manager
+        self.log = log
+
+    def copy(self):
+        return PlanState(self.things_state, self.time, self.current_w, self.income_per_second,
+                         self.buff_manager.copy(), list(self.log))
+
+    def restore(self, simulation_things):
+        self.things_state.restore(simulation_things)
+
+    def append(self, t, income, thing, cost, quantity):
+        self.log.append((t, income, thing, cost, quantity))
+
+    def advance(self, seconds):
+        # Simulate seconds without purchases, income only changes when a buff runs out
+        while seconds > 0:
+            next_expiry = self.buff_manager.next_expiry()
+            ticks = seconds if next_expiry is None else min(seconds, next_expiry)
+
+            self.current_w += self.income_per_second * ticks
+            self.buff_manager.skip(ticks - 1)
+            self.income_per_second += self.buff_manager.use()
+            self.time += ticks
+            seconds -= ticks
+
+
+class PurchaseModel:
+    # Deterministic purchase order model: wait until the chosen thing is affordable, then buy it
+    def __init__(self, simulation_things, time_steps):
+        self.simulation_things = simulation_things
+        self.time_steps = time_steps
+        self.names = [thing.name for thing in simulation_things]
+
+    def initial_state(self):
+        income_per_second = ThingMaker.current_income(self.simulation_things)
+
+        if income_per_second == 0:
+            income_per_second = 0.1
+
+        return PlanState(SimulationState.capture(self.simulation_things), 0, 0, income_per_second, BuffManager(), [])
+
+    def actions(self, state, all_buyable=False):
+        # Things the weighted rollout could pick, most efficient first
+        state.restore(self.simulation_things)
+
+        if all_buyable:
+            # Including the ones paying back after the horizon, they still raise the final income
+            efficiencies = [thing.efficiency if thing.buyable else 0 for thing in self.simulation_things]
+        else:
+            weights = PurchaseWeights(self.simulation_things, state.income_per_second, self.time_steps)
+            efficiencies = [weights.weight(i) for i in range(len(self.simulation_things))]
+
+        actions = [i for i, efficiency in enumerate(efficiencies) if efficiency > 0]
+        return sorted(actions, key=efficiencies.__getitem__, reverse=True)
+
+    def step(self, state, index, at=None):
+        # State after buying index as soon as it is affordable (and not before at), None past the horizon
+        state = state.copy()
+        state.restore(self.simulation_things)
+        thing = self.simulation_things[index]
+
+        if not thing.buyable:
+            return None
+
+        if at is not None and at > state.time:
+            if at >= self.time_steps:
+                return None
+            state.advance(at - state.time)
+
+        cost = thing.current_cost
+        while True:
+            seconds = None
+            if cost <= state.current_w:
+                seconds = 1
+            elif state.income_per_second > 0:
+                seconds = self.seconds_until_affordable(cost, state.current_w, state.income_per_second)
+
+            next_expiry = state.buff_manager.next_expiry()
+            if seconds is None or (next_expiry is not None and seconds > next_expiry):
+                if next_expiry is None or state.time + next_expiry > self.time_steps:
+                    return None
+                state.advance(next_expiry)
+                continue
+
+            if state.time + seconds > self.time_steps:
+                return None
+
+            state.advance(seconds)
+            break
+
+        state.current_w, state.income_per_second = self.buy(
+            self.simulation_things, index, state.time - 1, state.current_w, state.income_per_second, state.buff_manager, state
+        )
+        state.things_state = SimulationState.capture(self.simulation_things)
+
+        return state
+
+    def finish(self, state):
+        # Income at the horizon when nothing else is bought
+        state = state.copy()
+        state.advance(self.time_steps - state.time)
+        return state.income_per_second
+
+    def records(self, state):
+        purchase_log = PurchaseLog(len(state.log))
+        for record in state.log:
+            purchase_log.append(*record)
+
+        return purchase_log.to_records(self.names)
+
+    @staticmethod
+    def buy(simulation_things, selected_index, t, current_w, income_per_second, buff_manager, purchase_log):
+        selected_obj = simulation_things[selected_index]
+        quantity = selected_obj.quantity
+        cost = selected_obj.current_cost
+        current_w -= cost
+
+        income_per_second += selected_obj.power_output
+
+        buff = selected_obj.buy()
+
+        income_per_second += buff_manager.add_buff(buff)
+
+        # Log the event
+        purchase_log.append(t, income_per_second, selected_index, cost, quantity)
+
+        return current_w, income_per_second
+
+    @staticmethod
+    def seconds_until_affordable(cost, current_w, income_per_second):
+        seconds = max(math.ceil((cost - current_w) / income_per_second), 1)
+
+        # Correct the rounding of the division
+        while current_w + income_per_second * seconds < cost:
+            seconds += 1
+        while seconds > 1 and current_w + income_per_second * (seconds - 1) >= cost:
+            seconds -= 1
+
+        return seconds
@@ -0,0 +1,119 @@
+import bisect
+from random import random
+
+from analyse.weighted_sampler import WeightedSampler
+from data.things.upgrade import Upgrade
+
+
+class PurchaseWeights:
+    # Rollout purchase weights: efficiency of every buyable thing a time_steps payback away,
+    # kept in a sampler and only updated where a purchase or an income change touches them
+    _ROUNDING = 1e-9
+
+    def __init__(self, simulation_things, income_per_second, time_steps, biases=None, t=0):
+        self._things = simulation_things
+        self._time_steps = time_steps
+        self._income = income_per_second
+
+        self._biases = biases
+        self._bias = None if biases is None else biases.row(t)
+
+        index = {thing.name: i for i, thing in enumerate(simulation_things)}
+        self._target = [index[thing.target] if isinstance(thing, Upgrade) else None for thing in simulation_things]
+        self._upgrades_of = [[] for _ in simulation_things]
+        for i, target in enumerate(self._target):
+            if target is not None:
+                self._upgrades_of[target].append(i)
+
+        # Things ordered by cost, to find which ones an income change or a wallet limit reaches
+        self._costs = [thing.current_cost for thing in simulation_things]
+        self._by_cost = sorted((cost, i) for i, cost in enumerate(self._costs))
+
+        self._sampler = WeightedSampler(len(simulation_things))
+        self._dropped = False
+        self._drop_position = 0
+        self.recalculate(income_per_second)
+
+    def _weight(self, index):
+        thing = self._things[index]
+        if not thing.buyable or thing.current_cost / self._income > self._time_steps:
+            return 0
+        if self._bias is not None:
+            return thing.efficiency * self._bias[index]
+        return thing.efficiency
+
+    @property
+    def total(self):
+        return self._sampler.total
+
+    def weight(self, index):
+        return self._sampler.weight(index)
+
+    def sample(self):
+        return self._sampler.sample(random())
+
+    def at(self, t):
+        # Switch to the biases of the bucket of second t, things already dropped stay dropped
+        if self._biases is None:
+            return
+
+        bias = self._biases.row(t)
+        if bias is self._bias:
+            return
+
+        old = self._bias
+        self._bias = bias
+        for i in range(len(self._things)):
+            weight = self._sampler.weight(i)
+            if weight:
+                self._sampler.update(i, weight / old[i] * bias[i])
+
+    def recalculate(self, income_per_second):
+        self._income = income_per_second
+        self._sampler.reset([self._weight(i) for i in range(len(self._things))])
+        self._dropped = False
+        self._drop_position = 0
+
+    def update(self, income_per_second):
+        if self._dropped:
+            self.recalculate(income_per_second)
+            return
+
+        if income_per_second == self._income:
+            return
+
+        low, high = sorted((self._income, income_per_second))
+        self._income = income_per_second
+
+        # Only things priced between the old and the new payback limit can change side
+        start = bisect.bisect_left(self._by_cost, (low * self._time_steps * (1 - self._ROUNDING),))
+        limit = high * self._time_steps * (1 + self._ROUNDING)
+        for cost, i in self._by_cost[start:]:
+            if cost > limit:
+                break
+            self._sampler.update(i, self._weight(i))
+
+    def bought(self, index):
+        cost = self._things[index].current_cost
+        if cost != self._costs[index]:
+            self._by_cost.pop(bisect.bisect_left(self._by_cost, (self._costs[index], index)))
+            bisect.insort(self._by_cost, (cost, index))
+            self._costs[index] = cost
+
+        if self._dropped:
+            return
+
+        # The thing itself and the upgrades whose power depends on the same target
+        self._sampler.update(index, self._weight(index))
+        target = self._target[index]
+        for i in self._upgrades_of[index if target is None else target]:
+            self._sampler.update(i, self._weight(i))
+
+    def drop_affordable(self, current_w):
+        # Things affordable with current_w get no more chances until the weights are recalculated
+        while self._drop_position < len(self._by_cost) and self._by_cost[self._drop_position][0] <= current_w:
+            i = self._by_cost[self._drop_position][1]
+            if self._sampler.weight(i):
+                self._sampler.update(i, 0)
+                self._dropped = True
+            self._drop_position += 1
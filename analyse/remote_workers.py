@@ -0,0 +1,208 @@
+import os
+import pickle
+import signal
+import sys
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from analyse.simulation import Simulation
+from managers.thing_maker import ThingMaker
+
+# Connections unpickle what they receive, only peers knowing this secret may connect
+AUTHKEY_VARIABLE = "SPACE_PLANNER_AUTHKEY"
+
+
+def load_authkey(authkey=None):
+    # The one given or the one of the environment, there is no default
+    authkey = authkey or os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"No authkey, set {AUTHKEY_VARIABLE} to a secret shared with the workers")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+class Coordinator:
+    # Lets workers on other machines join the running simulation, each one reporting into a slot of its own
+    def __init__(self, simulation, address=("localhost", 6000), authkey=None, poll_interval=0.1):
+        self.simulation = simulation
+        self.address = address
+        self.authkey = authkey
+        self.poll_interval = poll_interval
+
+        # Slot of every connected worker and the address it connected from
+        self.workers = {}
+        self._listener = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._listener is not None
+
+    def start(self, address=None, authkey=None):
+        # Raises ValueError without an authkey
+        if self.running:
+            return False
+
+        if address is not None:
+            self.address = address
+        self._listener = Listener(self.address, authkey=load_authkey(authkey or self.authkey))
+        threading.Thread(target=self._accept, args=(self._listener,), daemon=True).start()
+        return True
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+
+    def _accept(self, listener):
+        while self._listener is listener:
+            try:
+                connection = listener.accept()
+            except AuthenticationError as e:
+                print(e)
+                continue
+            except OSError:
+                return
+
+            slot = self._take_slot(listener.last_accepted)
+            if slot is None:
+                print(f"No slot left for the worker at {listener.last_accepted}")
+                connection.close()
+                continue
+
+            threading.Thread(target=self._serve, args=(slot, connection), daemon=True).start()
+
+    def _take_slot(self, address):
+        first = self.simulation.process_count
+        with self._lock:
+            for slot in range(first, first + self.simulation.remote_slots):
+                if slot not in self.workers:
+                    self.workers[slot] = address
+                    return slot
+        return None
+
+    def _serve(self, slot, connection):
+        # Keeps the worker on the same run and things as the local ones and writes what it reports in its slot
+        run = None
+        generation = None
+        try:
+            while True:
+                configuration = self.simulation.configuration
+                if self.simulation.running_simulation and configuration is not None:
+                    things_generation, data = self.simulation.shared_memory.catalog_bytes
+                    if configuration["run"] != run:
+                        connection.send(("start", configuration, things_generation, data))
+                        run, generation = configuration["run"], things_generation
+                    elif things_generation != generation:
+                        connection.send(("things", None, things_generation, data))
+                        generation = things_generation
+                elif run is not None:
+                    connection.send(("pause", None, None, None))
+                    run = None
+
+                if connection.poll(self.poll_interval):
+                    self._receive(slot, connection.recv())
+        except (OSError, EOFError):
+            pass
+        finally:
+            connection.close()
+            with self._lock:
+                del self.workers[slot]
+
+    def _receive(self, slot, message):
+        kind, run, generation = message[:3]
+
+        # Reports of an older run would be written over the reset counters
+        configuration = self.simulation.configuration
+        if configuration is None or run != configuration["run"]:
+            return
+
+        shared_memory = self.simulation.shared_memory
+        current = generation == shared_memory.things_generation
+        if kind == "stats":
+            rollouts, since_last_thing, income, pruned_rollouts, pruned_steps = message[3:]
+            if not current:
+                # Rollouts of things that were bought since don't count for the average income
+                since_last_thing, income = 0, 0
+            shared_memory.set_counts(slot, rollouts, since_last_thing, income, pruned_rollouts, pruned_steps)
+        elif kind == "best" and current:
+            income, index, log = message[3:]
+            if income > shared_memory.best_income:
+                shared_memory.publish_best(slot, income, index, log)
+
+
+class RemoteWorker:
+    # Runs a local pool for a coordinator, sending its totals every report_interval seconds and every better plan
+    def __init__(self, address, authkey=None, process_count=None, report_interval=0.5):
+        self.address = address
+        self.authkey = load_authkey(authkey)
+        self.report_interval = report_interval
+
+        self.thing_maker = ThingMaker()
+        self.simulation = Simulation(self.thing_maker, process_count, remote_slots=0, checkpoint_interval=None, sessions=1)
+        self.thing_maker.shared_memory = self.simulation.shared_memory
+
+    def run(self):
+        connection = Client(self.address, authkey=self.authkey)
+        print(f"Connected to {self.address} with {self.simulation.process_count} processes")
+
+        run = None
+        generation = None
+        best_sent = 0
+        try:
+            while True:
+                if connection.poll(self.report_interval):
+                    command, configuration, things_generation, data = connection.recv()
+                    if command == "start":
+                        if self.simulation.running_simulation:
+                            self.simulation.end_simulation()
+                        self.simulation.start_simulation(
+                            configuration["start_income"], configuration["time_steps"], configuration["engine"],
+                            configuration["planner"], configuration["adaptive"], things=pickle.loads(data)
+                        )
+                        run, generation, best_sent = configuration["run"], things_generation, 0
+                    elif command == "things":
+                        # A thing was bought
+                        self.simulation.buy_thing()
+                        self.simulation.shared_memory.things = pickle.loads(data)
+                        generation = things_generation
+                    elif command == "pause":
+                        self.simulation.end_simulation()
+                        run = None
+
+                if run is not None:
+                    best_sent = self._report(connection, run, generation, best_sent)
+        except (OSError, EOFError):
+            print("Coordinator disconnected")
+        finally:
+            connection.close()
+            self.simulation.shutdown()
+
+    def _report(self, connection, run, generation, best_sent):
+        shared_memory = self.simulation.shared_memory
+        connection.send((
+            "stats", run, generation, sum(shared_memory.simulation_index),
+            sum(shared_memory.simulation_index_since_last_thing), sum(shared_memory.total_income),
+            sum(shared_memory.pruned_rollouts), sum(shared_memory.pruned_steps)
+        ))
+
+        # The log only travels when it improved
+        if shared_memory.best_income > best_sent:
+            income, index, log = shared_memory.best()
+            connection.send(("best", run, generation, income, index, log))
+            best_sent = income
+        return best_sent
+
+
+if __name__ == '__main__':
+    host = sys.argv[1] if len(sys.argv) > 1 else "localhost"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 6000
+    process_count = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    # The forked workers hold the connection too, stop them before leaving so the coordinator sees it close
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        remote_worker = RemoteWorker((host, port), process_count=process_count)
+    except ValueError as e:
+        sys.exit(str(e))
+    remote_worker.run()
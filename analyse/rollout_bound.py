@@ -0,0 +1,192 @@
+import heapq
+import math
+
+from data.things.upgrade import Upgrade
+
+
+class RolloutBound:
+    # Optimistic final income from a rollout state: the upgrades it can afford are free, debuffs end now and money
+    # buys fractions of things, in order of efficiency, the moment it is earned. A buff ending before the horizon
+    # pays its whole value the moment it is bought, one that could still be running at the horizon never runs out
+    def __init__(self, simulation_things, time_steps):
+        self.simulation_things = simulation_things
+        self.time_steps = time_steps
+
+        index = {thing.name: i for i, thing in enumerate(simulation_things)}
+        self._upgrades = [(i, index[thing.target]) for i, thing in enumerate(simulation_things) if isinstance(thing, Upgrade)]
+        self._potato_types = [i for i, thing in enumerate(simulation_things) if not isinstance(thing, Upgrade)]
+
+        # Cheapest of the next two units per thing and quantity
+        self._costs = {}
+        # Efficiency of the last money spent in the last bound, how fast it shrinks as time runs out
+        self.efficiency = 0
+
+    def _cost(self, i, quantity):
+        key = i, quantity
+        cost = self._costs.get(key)
+        if cost is None:
+            # The next unit never costs more than the one after it, keeping every thing's efficiency decreasing
+            thing = self.simulation_things[i]
+            cost = min(thing.cost_at(quantity), thing.cost_at(quantity + 1))
+            self._costs[key] = cost
+        return cost
+
+    def quick_bound(self, t, current_w, income_per_second, buff_manager):
+        # Looser but a few times cheaper: all the money compounds at the best efficiency on offer now
+        return self._bound(self._compound, t, current_w, income_per_second, buff_manager)
+
+    def bound(self, t, current_w, income_per_second, buff_manager):
+        # t is the last simulated second
+        return self._bound(self._relaxation, t, current_w, income_per_second, buff_manager)
+
+    def _bound(self, relaxation, t, current_w, income_per_second, buff_manager):
+        things = self.simulation_things
+        candidates = [(i, target) for i, target in self._upgrades if things[i].buyable]
+        schedule = buff_manager.schedule()
+
+        # Grown from none: an upgrade is only free once the money made with the ones before pays for it
+        upgrades = []
+        while True:
+            income, money = relaxation(self.time_steps - t - 1, current_w, income_per_second, schedule, upgrades)
+
+            affordable = [(i, target) for i, target in candidates if things[i].current_cost <= money]
+            if len(affordable) == len(upgrades):
+                return income
+            upgrades = affordable
+
+    def _compound(self, seconds, money, income, schedule, upgrades):
+        # Final income and all the money made until the horizon if dI/dt = efficiency * I
+        things = self.simulation_things
+
+        bonus = {}
+        for i, target in upgrades:
+            bonus[target] = bonus.get(target, 1) * things[i].multiplier
+
+        income += sum(change for _, change in schedule if change > 0)
+
+        efficiency = 0
+        for i in self._potato_types:
+            thing = things[i]
+            multiplier = bonus.get(i, 1)
+            power = thing.base_power_output * thing.multiplier * multiplier
+            income += power * thing.quantity / multiplier * (multiplier - 1)
+
+            buff = 0
+            if thing.buff is not None and thing.buff.value > 0:
+                buff = thing.buff.value * multiplier
+            efficiency = max(efficiency, (power + buff) / self._cost(i, thing.quantity))
+
+        self.efficiency = efficiency
+        if efficiency == 0 or seconds <= 0:
+            return income, money + max(income, 0) * max(seconds, 0)
+
+        # The wallet is spent at once
+        income += efficiency * money
+        growth = math.exp(efficiency * seconds)
+        return income * growth, money + income * (growth - 1) / efficiency
+
+    def _relaxation(self, seconds, money, income, schedule, upgrades):
+        # Final income and all the money made until the horizon
+        things = self.simulation_things
+
+        bonus = {}
+        for i, target in upgrades:
+            bonus[target] = bonus.get(target, 1) * things[i].multiplier
+
+        for ticks, change in schedule:
+            if change > 0:
+                income += change
+            elif ticks < seconds:
+                income += change
+                money -= change * ticks
+
+        powers = {}
+        buffs = {}
+        window = 0
+        for i in self._potato_types:
+            thing = things[i]
+            multiplier = bonus.get(i, 1)
+            power = thing.base_power_output * thing.multiplier
+            income += power * thing.quantity * (multiplier - 1)
+            powers[i] = power * multiplier
+
+            if thing.buff is not None and thing.buff.value > 0:
+                buffs[i] = thing.buff.value * multiplier, thing.buff.duration
+                window = max(window, thing.buff.duration)
+        window = max(min(window, seconds), 0)
+
+        def push(units, i, quantity, fraction, last):
+            cost = self._cost(i, quantity)
+            if not powers[i] or not cost or not math.isfinite(cost):
+                return
+
+            value, duration = buffs.get(i, (0, 0))
+            power = powers[i] + value
+            net = cost
+            if not last:
+                # Money made before the window can also be kept for a unit whose buff is still running at the
+                # horizon, so the unit counts as the better of both. A buff worth more than the unit would pay
+                # for itself keeps a sliver of the cost
+                rebated = max(cost - value * duration, cost * 1e-3)
+                if powers[i] / rebated > power / cost:
+                    power = powers[i]
+                    net = rebated
+            heapq.heappush(units, (-power / net, i, quantity, fraction, power, net, cost))
+
+        units = []
+        for i in self._potato_types:
+            push(units, i, things[i].quantity, 1, seconds <= window)
+
+        total = money
+        income, money, total = self._fill(units, push, income, money, total, seconds - window, False)
+
+        # Buffs bought from here on can still be running at the horizon
+        last = []
+        for _, i, quantity, fraction, _, _, _ in units:
+            push(last, i, quantity, fraction, True)
+
+        income, money, total = self._fill(last, push, income, money, total, window, True)
+        self.efficiency = -last[0][0] if last else 0
+        return income, total
+
+    @staticmethod
+    def _fill(units, push, income, money, total, seconds, last):
+        # Spend the wallet first
+        while units and money > 0:
+            efficiency, i, quantity, fraction, power, net, cost = units[0]
+            if net * fraction <= money:
+                heapq.heappop(units)
+                money -= net * fraction
+                income += power * fraction
+                total += (cost - net) * fraction
+                push(units, i, quantity + 1, 1, last)
+            else:
+                bought = money / net
+                income += power * bought
+                total += (cost - net) * bought
+                units[0] = (efficiency, i, quantity, fraction - bought, power, net, cost)
+                money = 0
+
+        # Then compound: filling a unit of efficiency e from income I takes log(1 + power / I) / e seconds
+        while units and seconds > 0 and income > 0:
+            efficiency, i, quantity, fraction, power, net, cost = units[0]
+            efficiency = -efficiency
+
+            fill = math.log1p(power * fraction / income) / efficiency
+            if fill <= seconds:
+                heapq.heappop(units)
+                seconds -= fill
+                income += power * fraction
+                total += cost * fraction
+                push(units, i, quantity + 1, 1, last)
+            else:
+                grown = income * math.exp(efficiency * seconds)
+                bought = (grown - income) / power
+                total += (grown - income) / efficiency + (cost - net) * bought
+                units[0] = (-efficiency, i, quantity, fraction - bought, power, net, cost)
+                income = grown
+                seconds = 0
+
+        if seconds > 0:
+            total += max(income, 0) * seconds
+        return income, money, total
@@ -1,14 +1,26 @@
+import math
 import multiprocessing
 import threading
-import warnings
-from random import choices
-
-import pandas as pd
-
+import time
+from random import choices, random
+
+from analyse.batch_simulation import BatchSimulation
+from analyse.branch_and_bound import BranchAndBound
+from analyse.checkpoint import Checkpoint
+from analyse.next_purchase import NextPurchase
+from analyse.plan_evaluator import PlanEvaluator
+from analyse.predictor import Predictor
+from analyse.purchase_biases import CrossEntropyBiases, EliteCollector, PurchaseBiases
+from analyse.purchase_log import PurchaseLog
+from analyse.purchase_model import PurchaseModel
+from analyse.purchase_weights import PurchaseWeights
+from analyse.rollout_bound import RolloutBound
+from analyse.simulation_session import SimulationSession
+from analyse.tree_search import MonteCarloTreeSearch
 from data.shared_memory import SharedMemory
+from data.things.potato_types import PotatoType
 from managers.buff_manager import BuffManager
 from managers.thing_maker import ThingMaker
-from managers.thing_maker_starter import ThingMakerStarter
 
 
 # 27s buff probetato
@@ -16,149 +28,868 @@ from managers.thing_maker_starter import ThingMakerStarter
 # day 3:11min night 25s 3:36total
 
 class Simulation:
-    def __init__(self, thing_maker, process_count=None):
-        self.running_simulation = False
+    STEP_ENGINE = 'step'
+    BATCH_ENGINE = 'batch'
+    EVENT_ENGINE = 'event'
+
+    RANDOM_PLANNER = 'random'
+    TREE_SEARCH_PLANNER = 'mcts'
+    BRANCH_AND_BOUND_PLANNER = 'branch_and_bound'
+
+    # Worker state of a run and its value on the first start of the run
+    RUN_STATE = {
+        "biases": None, "_bias_generation": 0, "_elite_collector": None, "_cross_entropy": None, "_best_income": 0,
+        "_best_refreshed_at": 0, "_rollout_bound": None, "_tree_search": None, "_branch_and_bound": None
+    }
+
+    def __init__(self, thing_maker, process_count=None, engine=STEP_ENGINE, batch_size=1024, planner=RANDOM_PLANNER,
+                 adaptive=False, bias_buckets=1, elite_fraction=0.05, adaptive_interval=2000, prune=True,
+                 prune_interval=30, best_refresh=0.5, flush_interval=16, remote_slots=8, checkpoint_interval=60,
+                 sessions=4, schedule_interval=1.0, switch_gap=10.0):
+        self.engine = engine
+        self.planner = planner
+        self.batch_size = batch_size
+
+        # Cross entropy sampling: the elite rollouts of every worker move the biases of the rollout weights
+        self.adaptive = adaptive
+        self.bias_buckets = bias_buckets
+        self.elite_fraction = elite_fraction
+        self.adaptive_interval = adaptive_interval
+        self.biases = None
+        self._elite_collector = None
+        self._cross_entropy = None
+
+        # Rollouts that can't beat the best income anymore are abandoned, checking every prune_interval seconds
+        # against a copy of the best income refreshed every best_refresh seconds
+        self.prune = prune
+        self.prune_interval = prune_interval
+        self.best_refresh = best_refresh
+        self.pruned_steps = 0
+        self._best_income = 0
+        self._best_refreshed_at = 0
+        self._rollout_bound = None
+        # Search of the worker kept between commands, plans evaluated meanwhile don't start it over
+        self._tree_search = None
+        self._branch_and_bound = None
+        # Price parameters generation the worker's Predictor was loaded with
+        self._parameters_generation = 0
         self.process_count = multiprocessing.cpu_count() if process_count is None else process_count
-        self.shared_memory = SharedMemory(self.process_count)
+        # Workers write their rollout counters every flush_interval rollouts
+        self.flush_interval = flush_interval
+        # Shared memory slots for workers on other machines, see Coordinator
+        self.remote_slots = remote_slots
+
+        # Every session has its shared memory made before the workers are forked, the first one is the default
+        # session the remote workers and the checkpoints are for
+        self.shared_memory = SharedMemory(self.process_count, self.flush_interval, remote_slots=remote_slots)
+        self.sessions = [SimulationSession(0, self.shared_memory, thing_maker, "default")]
+        for slot in range(1, sessions):
+            shared_memory = SharedMemory(self.process_count, self.flush_interval, manager=self.shared_memory.manager)
+            self.sessions.append(SimulationSession(slot, shared_memory, ThingMaker()))
+        self._session_lock = threading.Lock()
+        # Session a worker searches for, switched by start
         self.thing_maker = thing_maker
+        self.thing_maker_starter = self.sessions[0].thing_maker_starter
+
+        # Workers forked on the first start and kept between simulations, each with a pipe for its commands
         self.processes = []
-        self.lock = threading.Lock()
+        self._connections = []
+        # Held while sending commands that are answered, so the answers aren't read by another request
+        self._command_lock = threading.Lock()
+        self._runs = 0
         self.start_income = None
         self.time_steps = None
-        self.thing_maker_starter = ThingMakerStarter(self.thing_maker)
-
-    @classmethod
-    def _calculate_normalized_efficiencies(cls, simulation_things, current_income, time_steps):
-        normalized_efficiencies = []
-
-        mask_efficiency = [thing.buyable and not thing.current_cost / current_income > time_steps for thing in simulation_things]
-        total_efficiency = sum(thing.efficiency for i, thing in enumerate(simulation_things) if mask_efficiency[i])
 
-        for i, thing in enumerate(simulation_things):
-            efficiency = 0
-
-            if mask_efficiency[i]:
-                efficiency = thing.efficiency / total_efficiency
+        # Every schedule_interval seconds the workers are handed out again between the running sessions, the
+        # configuration and whether it leads the session of what each one was last started with. A worker only moves
+        # once its session is switch_gap worker seconds for its weight ahead, a move throws away its search
+        self.schedule_interval = schedule_interval
+        self.switch_gap = switch_gap
+        self._assignment = []
+        self._assigned_at = time.monotonic()
+        self._scheduler = None
+        # Runs branch and bound and the cross entropy updates of its session
+        self._lead = False
+        # Session and run the worker searches, and the state of the last run of every other session it searched
+        self._run = None
+        self._run_states = {}
+
+        # Search state written every checkpoint_interval seconds while running, None to never write it
+        self.checkpoint = Checkpoint(self.sessions[0], interval=checkpoint_interval) if checkpoint_interval else None
+        # Whether the last start carried on from the checkpoint
+        self.resumed = False
+
+    @property
+    def running_simulation(self):
+        return self.sessions[0].running_simulation
+
+    @property
+    def configuration(self):
+        return self.sessions[0].configuration
+
+    def find_session(self, name):
+        # The open session of that name, None if there is none
+        with self._session_lock:
+            for session in self.sessions:
+                if session.name == name:
+                    return session
+        return None
+
+    def open_session(self, name):
+        # The session of that name, a free one the first time, None when all are taken
+        with self._session_lock:
+            for session in self.sessions:
+                if session.name == name:
+                    return session
+
+            for session in self.sessions:
+                if session.name is None:
+                    session.name = name
+                    session.thing_maker._save_file = f'resource/save/things_{name}.json'
+                    return session
+
+        return None
+
+    def close_session(self, session):
+        self.end_simulation(session=session.slot)
+        with self._session_lock:
+            session.name = None
+            session.configuration = None
+            session.shared_memory.things = []
+            session.shared_memory.reset_run()
+
+    def start_simulation(self, start_income, time_steps, engine=None, planner=None, adaptive=None, things=None,
+                         resume=False, session=0, weight=None):
+        session = self.sessions[session]
+        if session.running_simulation:
+            return False
 
-            normalized_efficiencies.append(efficiency)
-        return normalized_efficiencies
+        session.start_income = start_income
+        session.time_steps = time_steps
+        if session.slot == 0:
+            self.start_income = start_income
+            self.time_steps = time_steps
+        if weight is not None:
+            session.weight = weight
+
+        previous = session.configuration or {}
+        engine = engine if engine is not None else previous.get("engine", self.engine)
+        planner = planner if planner is not None else previous.get("planner", self.planner)
+        adaptive = adaptive if adaptive is not None else previous.get("adaptive", self.adaptive)
+        session.running_simulation = True
+        # No run to follow until the things are loaded
+        session.configuration = None
+
+        # No worker searches this session, nothing else writes its slots
+        session.shared_memory.reset_run()
+
+        if things is None:
+            session.load_things()
+        else:
+            # Things sent by a coordinator
+            session.shared_memory.things = things
+
+        if session.slot == 0:
+            self.resumed = resume and self.checkpoint is not None and self.checkpoint.resume()
+
+        with self._command_lock:
+            self._start_pool()
+            self._runs += 1
+            # It starts even with the running sessions instead of catching up on the time it was idle
+            running = [other.service for other in self.sessions if other.running_simulation and other.configuration]
+            session.service = min(running, default=0)
+
+            session.configuration = {
+                "run": self._runs,
+                "session": session.slot,
+                "start_income": start_income,
+                "time_steps": time_steps,
+                "engine": engine,
+                "planner": planner,
+                "adaptive": adaptive,
+                "things_generation": session.shared_memory.things_generation
+            }
+            self._assign()
+
+        if session.slot == 0 and self.checkpoint is not None:
+            self.checkpoint.start()
+        return True
 
-    def start_simulation(self, start_income, time_steps):
-        if self.running_simulation:
-            return False
+    def end_simulation(self, timeout=5, session=0):
+        # Its workers stop between rollouts and go to the other running sessions
+        session = self.sessions[session]
+        if session.running_simulation:
+            session.shared_memory.stop_clock()
+        session.running_simulation = False
+        with self._command_lock:
+            workers = [i for i, assigned in enumerate(self._assignment)
+                       if assigned is not None and assigned[0]["session"] == session.slot]
+            for i in workers:
+                try:
+                    self._connections[i].send(("pause", None))
+                except OSError:
+                    pass
+            for i in workers:
+                try:
+                    if not self._connections[i].poll(timeout):
+                        raise TimeoutError
+                    self._connections[i].recv()
+                except (OSError, EOFError):
+                    # Only this one, the workers of the other sessions go on
+                    print(f"Worker {i} didn't pause, starting a new one")
+                    self._replace_worker(i)
+                self._assignment[i] = None
 
-        self.start_income = start_income
-        self.time_steps = time_steps
-        self.running_simulation = True
-        self.shared_memory = SharedMemory(self.process_count)
-        self.thing_maker.shared_memory = self.shared_memory
+            try:
+                self._assign()
+            except OSError:
+                pass
+
+        # Everything the workers counted is written now
+        if session.slot == 0 and self.checkpoint is not None:
+            self.checkpoint.stop()
+            self.checkpoint.write()
+
+    def _assign(self):
+        # With the command lock held. Workers stay on their session and free ones go to the running session with the
+        # fewest worker seconds for its weight. Then one moves from the session furthest ahead to the one furthest
+        # behind, right away when that one has none and the other has more than one, otherwise past switch_gap
+        now = time.monotonic()
+        elapsed, self._assigned_at = now - self._assigned_at, now
+        for session in self.sessions:
+            if session.running_simulation and session.configuration is not None:
+                session.service += elapsed * session.workers / session.weight
+
+        running = [session for session in self.sessions if session.running_simulation and session.configuration is not None]
+        for session in self.sessions:
+            session.workers = 0
+        if not running or not self._connections:
+            return
+
+        assignment = [None] * len(self._connections)
+        for i, assigned in enumerate(self._assignment):
+            if assigned is not None and self.sessions[assigned[0]["session"]] in running:
+                assignment[i] = self.sessions[assigned[0]["session"]]
+
+        planned = {session.slot: session.service for session in running}
+        for i in range(len(assignment)):
+            if assignment[i] is None:
+                assignment[i] = min(running, key=lambda session: planned[session.slot])
+                planned[assignment[i].slot] += self.schedule_interval / assignment[i].weight
+
+        for session in running:
+            session.workers = assignment.count(session)
+        behind = min(running, key=lambda session: (session.workers > 0, session.service))
+        ahead = max((session for session in running if session.workers > 0), key=lambda session: session.service)
+        # Taking the only worker of a session waits for the gap too, sessions then take turns
+        gap = ahead.service - behind.service > self.switch_gap
+        if ahead is not behind and ((ahead.workers > 1 and (behind.workers == 0 or gap)) or (behind.workers == 0 and gap)):
+            # The last one, its lead stays
+            i = len(assignment) - 1 - assignment[::-1].index(ahead)
+            assignment[i] = behind
+            ahead.workers -= 1
+            behind.workers += 1
+
+        # A session keeps its lead while it has the worker
+        leads = {}
+        for i, assigned in enumerate(self._assignment):
+            if assigned is not None and assigned[1] and assignment[i] is self.sessions[assigned[0]["session"]]:
+                leads[assignment[i].slot] = i
+        for i, session in enumerate(assignment):
+            leads.setdefault(session.slot, i)
+
+        for i, session in enumerate(assignment):
+            lead = leads[session.slot] == i
+            if self._assignment[i] != (session.configuration, lead):
+                self._connections[i].send(("start", dict(session.configuration, lead=lead)))
+                self._assignment[i] = session.configuration, lead
+
+    def _schedule(self):
+        while True:
+            time.sleep(self.schedule_interval)
+            with self._command_lock:
+                try:
+                    self._assign()
+                except OSError:
+                    pass
+
+    def evaluate(self, plans, time_steps, log=True, session=0, timeout=60):
+        # Final income and purchases of plans of (thing name, not before second or None), from the things of the
+        # session as they are now. Split over the workers in sorted order, plans sharing a start mostly go to the same one
+        session = self.sessions[session]
+        if not session.shared_memory.catalog:
+            session.load_things()
+
+        index = session.shared_memory.thing_table.index
+        for plan in plans:
+            for name, _ in plan:
+                if name not in index:
+                    raise ValueError(f"Unknown thing {name}")
+        indexed = [[(index[name], at) for name, at in plan] for plan in plans]
+        order = sorted(range(len(indexed)), key=lambda i: PlanEvaluator.sort_key(indexed[i]))
+
+        with self._command_lock:
+            self._start_pool()
+            chunk = -(-len(order) // len(self._connections)) or 1
+            chunks = [order[start:start + chunk] for start in range(0, len(order), chunk)]
+            for connection, chunk_order in zip(self._connections, chunks):
+                connection.send(("evaluate", {"session": session.slot, "plans": [indexed[i] for i in chunk_order],
+                                              "time_steps": time_steps, "log": log}))
+
+            # Every reply is read before raising, a leftover one would answer the next command
+            results = [None] * len(plans)
+            failed = False
+            for worker, chunk_order in enumerate(chunks):
+                try:
+                    if not self._connections[worker].poll(timeout):
+                        raise TimeoutError
+                    chunk_results = self._connections[worker].recv()
+                except (OSError, EOFError):
+                    print(f"Worker {worker} didn't evaluate its plans, starting a new one")
+                    self._replace_worker(worker)
+                    failed = True
+                    continue
+                if chunk_results is None:
+                    failed = True
+                    continue
+                for i, result in zip(chunk_order, chunk_results):
+                    results[i] = result
+
+            if failed:
+                try:
+                    self._assign()
+                except OSError:
+                    pass
+                raise RuntimeError("A worker couldn't evaluate its plans")
+
+        return results
+
+    def next_purchase(self, deadline, time_steps=None, session=0):
+        # Thing to buy now found before deadline, a time.monotonic() value. The first purchase of the best plan of the
+        # running search while it's still the one to make, unless the lookahead finds a better one meanwhile
+        session = self.sessions[session]
+        if not session.shared_memory.catalog:
+            session.load_things()
+
+        things = session.shared_memory.things
+        index = session.shared_memory.thing_table.index
+        time_steps = time_steps or session.time_steps or 900
+
+        searched = None
+        if session.running_simulation and session.configuration and session.configuration["time_steps"] == time_steps:
+            best_income, _, best_log = session.shared_memory.best()
+            first = best_log[0] if best_log else None
+            if first is not None and first["Thing"] in index:
+                thing = things[index[first["Thing"]]]
+                # Bought since if the quantity moved on
+                if thing.buyable and thing.quantity == first["Quantity"]:
+                    searched = {
+                        "thing": thing.name,
+                        "cost": thing.current_cost,
+                        "income": best_income,
+                        "source": "search",
+                        "visits": sum(session.shared_memory.simulation_index_since_last_thing),
+                        "confidence": None,
+                        "depth": None
+                    }
+
+        suggestion = NextPurchase(things, time_steps).suggest(deadline)
+        if searched is not None and (suggestion is None or suggestion["income"] is None
+                                     or suggestion["income"] <= searched["income"]):
+            return searched
+        return suggestion
+
+    def shutdown(self):
+        for connection in self._connections:
+            try:
+                connection.send(("stop", None))
+            except OSError:
+                pass
 
-        self.thing_maker_starter.start()
-        self.thing_maker.load_thing_maker()
+        for i, process in enumerate(self.processes):
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            self._release(i)
 
         self.processes = []
-        for i in range(self.process_count):
-            self.processes.append(multiprocessing.Process(target=self.run_simulation, args=(i,)))
-            self.processes[i].start()
-        return True
-
-    def end_simulation(self):
-        self.running_simulation = False
-        for process in self.processes:
-            process.terminate()
+        self._connections = []
+        self._assignment = []
+
+    def _release(self, i):
+        # A best the stopped worker was publishing in any session is dropped, readers don't wait for it
+        for session in self.sessions:
+            session.shared_memory.release(i)
+
+    def _replace_worker(self, i):
+        # With the command lock held
+        process = self.processes[i]
+        # Killed, a stopped process never handles a terminate
+        process.kill()
+        process.join()
+        self._connections[i].close()
+        self._release(i)
+
+        self.processes[i], self._connections[i] = self._fork_worker(i)
+        self._assignment[i] = None
+
+    def _fork_worker(self, i):
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=self.run_simulation, args=(i, worker_connection), daemon=True)
+        process.start()
+        return process, connection
+
+    def _start_pool(self):
+        # With the command lock held, concurrent first requests fork a single pool
+        if self.processes:
+            return
 
-    def run_simulation(self, process_id):
-        count = 0
-        while True:
+        for i in range(self.process_count):
+            process, connection = self._fork_worker(i)
+            self.processes.append(process)
+            self._connections.append(connection)
+        self._assignment = [None] * self.process_count
+
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._schedule, daemon=True)
+            self._scheduler.start()
+
+    def run_simulation(self, process_id, connection):
+        # Searches until the next command arrives, start also changes the configuration of a running search and
+        # a search goes on after evaluating plans
+        searching = False
+        command, configuration = connection.recv()
+        while command != "stop":
+            if command == "start":
+                self._configure(process_id, configuration)
+                searching = True
+            elif command == "evaluate":
+                connection.send(self._evaluate(configuration))
+            else:
+                # Everything counted so far is written before the next start resets it
+                self.shared_memory.flush(process_id)
+                connection.send("paused")
+                searching = False
+
+            if searching:
+                self._search(process_id, connection)
+            command, configuration = connection.recv()
+
+    def _configure(self, process_id, configuration):
+        for name in ("start_income", "time_steps", "engine", "planner", "adaptive"):
+            setattr(self, name, configuration[name])
+        # Started by a coordinator there is a single session, led by the first worker
+        self._lead = configuration.get("lead", process_id == 0)
+
+        session = self.sessions[configuration.get("session", 0)]
+        if session.shared_memory is not self.shared_memory:
+            # What was counted for the last session is written before searching another
+            self.shared_memory.flush(process_id)
+            self.shared_memory = session.shared_memory
+            self.thing_maker = session.thing_maker
+
+        run = session.slot, configuration["run"]
+        if run != self._run:
+            # Kept for when the worker comes back to the run it leaves, a start of another run begins anew
+            if self._run is not None:
+                self._run_states[self._run[0]] = self._run[1], {name: getattr(self, name) for name in self.RUN_STATE}
+            last_run, state = self._run_states.pop(session.slot, (None, None))
+            if last_run != run[1]:
+                state = self.RUN_STATE
+            for name, value in state.items():
+                setattr(self, name, value)
+            self._run = run
+        self.pruned_steps = 0
+
+        if self._lead and self.biases is not None and self._cross_entropy is None:
+            # Leads a run it searched without leading it
+            self._cross_entropy = CrossEntropyBiases(self.biases, self.elite_fraction,
+                                                     generation=self.shared_memory.bias_generation)
+
+    def _reload_parameters(self):
+        # The generation of the prices is kept by the first session for all of them
+        parameters_generation = self.sessions[0].shared_memory.parameters_generation
+        if parameters_generation != self._parameters_generation:
+            # Before the things, which were published with costs of the new parameters
+            self._parameters_generation = parameters_generation
+            Predictor.reload_parameters()
+            for session in self.sessions:
+                session.thing_maker.forget_simulation_things()
+
+    def _evaluate(self, request):
+        try:
+            self._reload_parameters()
+            simulation_things = self.sessions[request["session"]].thing_maker.reset_simulation_things()
+            return PlanEvaluator(simulation_things, request["time_steps"]).evaluate(request["plans"], request["log"])
+        except Exception as e:
+            print(f"Plans not evaluated: {e}")
+            return None
+
+    def _search(self, process_id, connection):
+        # Reused by every rollout of this process
+        purchase_log = PurchaseLog(self.time_steps)
+
+        while not connection.poll():
             try:
-                simulation_index = self.shared_memory.simulation_index[process_id]
-                current_log = pd.DataFrame(columns=["Time", "Income", "Thing", "Cost", "Quantity"])
+                self._reload_parameters()
 
+                simulation_index = self.shared_memory.rollout_index(process_id)
                 simulation_things = self.thing_maker.reset_simulation_things()
 
                 if simulation_things is None:
                     print("Simulation things is None")
                     continue
 
-                buff_manager = BuffManager()
-
-                income_per_second = ThingMaker.current_income(simulation_things)
-
-                if income_per_second == 0:
-                    income_per_second = 0.1
-
-                current_w = 0
-                # Calculate total efficiency
-                normalized_efficiencies = self._calculate_normalized_efficiencies(simulation_things, income_per_second, self.time_steps)
-                last_bought = False
-
-                for t in range(self.time_steps):
-                    current_w += income_per_second  # accumulate income
-                    income_per_second += buff_manager.use()
-
-                    if last_bought:
-                        normalized_efficiencies = self._calculate_normalized_efficiencies(simulation_things, income_per_second, self.time_steps)
-                    else:
-                        normalized_efficiencies = [
-                            0 if upgrade.current_cost <= current_w - income_per_second else efficiency
-                            for upgrade, efficiency in zip(simulation_things, normalized_efficiencies)
-                        ]
-
-                    # Decide what to buy based on normalized efficiencies
-                    selected_obj = choices(simulation_things, weights=normalized_efficiencies, k=1)[0]
-
-                    if selected_obj.current_cost <= current_w:
-                        last_bought = False
-                        if selected_obj.buyable:
-                            quantity = selected_obj.quantity
-                            cost = selected_obj.current_cost
-                            current_w -= cost
-                            last_bought = True
-
-                            income_per_second += selected_obj.power_output
-
-                            buff = selected_obj.buy()
-
-                            income_per_second += buff_manager.add_buff(buff)
-
-                            # Log the event
-                            with warnings.catch_warnings():
-                                warnings.simplefilter(action='ignore', category=FutureWarning)
-                                current_log = pd.concat([current_log, pd.DataFrame([{
-                                    "Time": t,
-                                    "Income": income_per_second,
-                                    "Thing": selected_obj.name,
-                                    "Cost": cost,
-                                    "Quantity": quantity
-                                }])], ignore_index=True)
-
-                if income_per_second > self.shared_memory.best_income:
-                    with self.lock:
-                        if income_per_second > self.shared_memory.best_income:
-                            self.shared_memory.best_income = income_per_second
-                            self.shared_memory.best_index = simulation_index
-                            self.shared_memory.best_log = current_log.to_dict(orient='records')
-
-                count += 1
-
+                if self.adaptive and self.biases is None:
+                    self._start_adaptive(process_id, len(simulation_things))
+
+                if time.monotonic() - self._best_refreshed_at >= self.best_refresh:
+                    self._best_income = self.shared_memory.best_income
+                    self._best_refreshed_at = time.monotonic()
+
+                if self.planner == self.BRANCH_AND_BOUND_PLANNER:
+                    if self._lead:
+                        branch_and_bound = self._branch_and_bound
+                        if branch_and_bound is None or branch_and_bound.simulation_things is not simulation_things:
+                            branch_and_bound = self._branch_and_bound = BranchAndBound(simulation_things, self.time_steps)
+
+                        if branch_and_bound.done:
+                            time.sleep(0.1)
+                        else:
+                            self._run_branch_and_bound(process_id, simulation_index, branch_and_bound)
+                        if self.adaptive:
+                            self._adapt(process_id, coordinate=True)
+                        continue
+
+                    if self.shared_memory.upper_bound <= self.shared_memory.best_income:
+                        # The best plan is proven optimal, no rollout can beat it until a thing is bought
+                        time.sleep(0.1)
+                        continue
+
+                if self.planner == self.TREE_SEARCH_PLANNER:
+                    # The tree is only valid for the things it was built from
+                    if self._tree_search is None or self._tree_search.simulation_things is not simulation_things:
+                        self._tree_search = MonteCarloTreeSearch(self, simulation_things)
+                    income_per_second, purchase_log = self._tree_search.iterate()
+                elif self.engine == self.BATCH_ENGINE:
+                    self._run_batch(process_id, simulation_index, simulation_things)
+                    if self.adaptive:
+                        self._adapt(process_id)
+                    continue
+                else:
+                    run_rollout = self.run_event_rollout if self.engine == self.EVENT_ENGINE else self.run_rollout
+                    cutoff = self._best_income if self.prune and self._best_income > 0 else None
+                    income_per_second, purchase_log = run_rollout(simulation_things, purchase_log, cutoff=cutoff)
+
+                    if self.pruned_steps:
+                        self.shared_memory.increase_pruned(process_id, self.pruned_steps)
+                        if self.adaptive:
+                            # Its purchases stop halfway, they would count against the ones bought late
+                            self._adapt(process_id)
+                        continue
+
+                self._update_best(process_id, income_per_second, simulation_index,
+                                  lambda: purchase_log.to_records([thing.name for thing in simulation_things]))
                 self.shared_memory.increase_simulation(process_id, income_per_second)
+
+                if self.adaptive:
+                    self._elite_collector.add(income_per_second, purchase_log.time, purchase_log.thing)
+                    self._adapt(process_id)
             except TypeError as e:
                 print(e)
                 continue
 
-    def save_simulation(self):
-        self.thing_maker.save_thing_maker()
+    def _run_batch(self, process_id, simulation_index, simulation_things):
+        batch_simulation = BatchSimulation(simulation_things, self.time_steps, self.batch_size, biases=self.biases)
+        result = batch_simulation.run()
+
+        if self.adaptive:
+            self._elite_collector.add_batch(result.incomes, *result.purchases)
+
+        best = int(result.incomes.argmax())
+        income_per_second = float(result.incomes[best])
+
+        self._update_best(process_id, income_per_second, simulation_index + best, lambda: result.log(best))
+        self.shared_memory.increase_simulation(process_id, float(result.incomes.sum()), self.batch_size)
+
+    def _run_branch_and_bound(self, process_id, simulation_index, branch_and_bound):
+        income_per_second = branch_and_bound.search(max_nodes=200)
+
+        self._update_best(process_id, income_per_second, simulation_index, branch_and_bound.best_log)
+        self.shared_memory.upper_bound = branch_and_bound.upper_bound
+        self.shared_memory.increase_simulation(process_id, income_per_second)
+
+    def _start_adaptive(self, process_id, thing_count):
+        self.biases = PurchaseBiases(thing_count, self.time_steps, self.bias_buckets, self.shared_memory.biases or None)
+        self._bias_generation = self.shared_memory.bias_generation
+        self._elite_collector = EliteCollector(self.biases, self.elite_fraction)
+
+        if self._lead:
+            self._cross_entropy = CrossEntropyBiases(self.biases, self.elite_fraction,
+                                                     generation=self.shared_memory.bias_generation)
+
+    def _adapt(self, process_id, coordinate=False):
+        # Every adaptive_interval rollouts each worker sends its elites, process 0 turns everything sent into new biases
+        if self._elite_collector.rollouts >= self.adaptive_interval:
+            self.shared_memory.submit_elites(self._elite_collector.take())
+        elif not coordinate:
+            return
+
+        if self._lead:
+            submissions = self.shared_memory.take_elites()
+            if not submissions:
+                return
+
+            biases = self._cross_entropy.update(submissions)
+            if biases is not None:
+                self.shared_memory.biases = biases.table.tolist()
+                self.shared_memory.bias_generation = self._cross_entropy.generation
+
+        bias_generation = self.shared_memory.bias_generation
+        if bias_generation != self._bias_generation:
+            self._bias_generation = bias_generation
+            self.biases = PurchaseBiases(self.biases.thing_count, self.time_steps, self.bias_buckets, self.shared_memory.biases)
+            self._elite_collector.biases = self.biases
+
+    def _update_best(self, process_id, income_per_second, simulation_index, make_log):
+        # The log is only built for a new best, published in this worker's slot so no other worker is waited for
+        if income_per_second <= self._best_income:
+            return
+
+        self._best_income = self.shared_memory.best_income
+        if income_per_second > self._best_income:
+            self.shared_memory.publish_best(process_id, income_per_second, simulation_index, make_log())
+            self._best_income = income_per_second
+
+    def _start_rollout(self, simulation_things, purchase_log, plan_state):
+        if purchase_log is None:
+            purchase_log = PurchaseLog(self.time_steps)
+        purchase_log.reset(self.time_steps)
+
+        if plan_state is None:
+            income_per_second = ThingMaker.current_income(simulation_things)
+
+            if income_per_second == 0:
+                income_per_second = 0.1
+
+            return purchase_log, BuffManager(), 0, 0, income_per_second, False
+
+        # Continue from a partial plan, its purchases start the log
+        plan_state.restore(simulation_things)
+        for record in plan_state.log:
+            purchase_log.append(*record)
+
+        return (purchase_log, plan_state.buff_manager.copy(), plan_state.time, plan_state.current_w,
+                plan_state.income_per_second, bool(plan_state.log))
+
+    def run_rollout(self, simulation_things, purchase_log=None, plan_state=None, cutoff=None):
+        purchase_log, buff_manager, start, current_w, income_per_second, last_bought = self._start_rollout(
+            simulation_things, purchase_log, plan_state
+        )
+        rollout_bound = self._get_rollout_bound(simulation_things, cutoff)
+        next_check = self._first_check(start)
+
+        # Calculate total efficiency
+        weights = PurchaseWeights(simulation_things, income_per_second, self.time_steps, self.biases, start)
+
+        for t in range(start, self.time_steps):
+            if rollout_bound is not None and t >= next_check:
+                next_check = self._check_bound(rollout_bound, cutoff, t, current_w, income_per_second, buff_manager)
+                if next_check is None:
+                    break
+
+            current_w += income_per_second  # accumulate income
+            income_per_second += buff_manager.use()
+
+            if last_bought:
+                weights.update(income_per_second)
+            else:
+                weights.drop_affordable(current_w - income_per_second)
+
+            # Decide what to buy based on the efficiency weights
+            weights.at(t)
+            selected_index = weights.sample()
+            if selected_index is None:
+                continue
+            selected_obj = simulation_things[selected_index]
 
-    def get_simulation_results(self):
-        return self.shared_memory
+            if selected_obj.current_cost <= current_w:
+                last_bought = False
+                if selected_obj.buyable:
+                    last_bought = True
+                    current_w, income_per_second = PurchaseModel.buy(
+                        simulation_things, selected_index, t, current_w, income_per_second, buff_manager, purchase_log
+                    )
+                    weights.bought(selected_index)
+
+        return income_per_second, purchase_log
+
+    def run_event_rollout(self, simulation_things, purchase_log=None, plan_state=None, cutoff=None):
+        purchase_log, buff_manager, t, current_w, income_per_second, last_bought = self._start_rollout(
+            simulation_things, purchase_log, plan_state
+        )
+        rollout_bound = self._get_rollout_bound(simulation_things, cutoff)
+        next_check = self._first_check(t)
+
+        weights = PurchaseWeights(simulation_things, income_per_second, self.time_steps, self.biases, t)
+
+        while t < self.time_steps:
+            if rollout_bound is not None and t >= next_check:
+                next_check = self._check_bound(rollout_bound, cutoff, t, current_w, income_per_second, buff_manager)
+                if next_check is None:
+                    break
+
+            if last_bought:
+                weights.update(income_per_second)
+            weights.at(t)
+
+            # Income is constant until a buff expires, so nothing happens before that or before something becomes affordable
+            next_event = self.time_steps
+            next_expiry = buff_manager.next_expiry()
+            if next_expiry is not None:
+                next_event = min(next_event, t + next_expiry - 1)
+            if self.biases is not None and self.biases.next_change(t) is not None:
+                next_event = min(next_event, self.biases.next_change(t))
+
+            affordable = []
+            for i, thing in enumerate(simulation_things):
+                if not weights.weight(i):
+                    continue
+                if thing.current_cost <= current_w:
+                    affordable.append(i)
+                elif income_per_second > 0:
+                    next_event = min(next_event, t - 1 + PurchaseModel.seconds_until_affordable(thing.current_cost, current_w, income_per_second))
+
+            skipped = next_event - t
+
+            # After the first purchase every second draws again, so the wait for an affordable draw is geometric
+            if last_bought and affordable:
+                affordable_weights = [weights.weight(i) for i in affordable]
+                wait = self._geometric(sum(affordable_weights) / weights.total)
+
+                if wait <= skipped:
+                    t += wait - 1
+                    current_w += income_per_second * wait
+                    buff_manager.skip(wait)
+
+                    selected_index = choices(affordable, weights=affordable_weights, k=1)[0]
+                    current_w, income_per_second = PurchaseModel.buy(
+                        simulation_things, selected_index, t, current_w, income_per_second, buff_manager, purchase_log
+                    )
+                    weights.bought(selected_index)
+
+                    t += 1
+                    continue
 
-    def reset_simulation(self):
-        if self.running_simulation:
+            if skipped > 0:
+                if not last_bought:
+                    # Each skipped second drops what was affordable the second before
+                    weights.drop_affordable(current_w + income_per_second * (skipped - 1))
+
+                current_w += income_per_second * skipped
+                buff_manager.skip(skipped)
+                t = next_event
+
+            if t >= self.time_steps:
+                break
+
+            # Simulate the event second exactly like run_rollout
+            current_w += income_per_second
+            income_per_second += buff_manager.use()
+
+            if last_bought:
+                weights.update(income_per_second)
+            else:
+                weights.drop_affordable(current_w - income_per_second)
+
+            weights.at(t)
+            selected_index = weights.sample()
+            if selected_index is not None:
+                selected_obj = simulation_things[selected_index]
+
+                if selected_obj.current_cost <= current_w and selected_obj.buyable:
+                    last_bought = True
+                    current_w, income_per_second = PurchaseModel.buy(
+                        simulation_things, selected_index, t, current_w, income_per_second, buff_manager, purchase_log
+                    )
+                    weights.bought(selected_index)
+
+            t += 1
+
+        return income_per_second, purchase_log
+
+    def _get_rollout_bound(self, simulation_things, cutoff):
+        self.pruned_steps = 0
+        if cutoff is None:
+            return None
+
+        if self._rollout_bound is None or self._rollout_bound.simulation_things is not simulation_things:
+            self._rollout_bound = RolloutBound(simulation_things, self.time_steps)
+        return self._rollout_bound
+
+    def _first_check(self, start):
+        # The bound is far too loose to prune anything in the first half of a rollout
+        return start + max((self.time_steps - start) // 2, self.prune_interval)
+
+    def _check_bound(self, rollout_bound, cutoff, t, current_w, income_per_second, buff_manager):
+        # Called at the start of second t, the next second worth checking or None when the rollout is pruned
+        bound = rollout_bound.quick_bound(t - 1, current_w, income_per_second, buff_manager)
+        efficiency = rollout_bound.efficiency
+
+        # The exact bound is worth its cost only close to the cutoff
+        if bound < cutoff or (bound < 2 * cutoff and rollout_bound.bound(t - 1, current_w, income_per_second, buff_manager) < cutoff):
+            self.pruned_steps = self.time_steps - t
+            return None
+
+        # Without buying anything the quick bound shrinks by about exp(efficiency) a second, faster when upgrades
+        # stop being affordable, so never wait more than half of the time left
+        wait = (self.time_steps - t) // 2
+        if efficiency > 0:
+            wait = min(wait, math.ceil(math.log(bound / cutoff) / efficiency))
+        return t + max(wait, self.prune_interval)
+
+    @staticmethod
+    def _geometric(p):
+        if p >= 1:
+            return 1
+        return int(math.log1p(-random()) / math.log1p(-p)) + 1
+
+    def save_simulation(self, session=0):
+        self.sessions[session].thing_maker.save_thing_maker()
+
+    def get_simulation_results(self, session=0):
+        return self.sessions[session].shared_memory
+
+    def reset_simulation(self, session=0):
+        session = self.sessions[session]
+        if session.running_simulation:
             return False
 
-        self.shared_memory.things = []
-        self.thing_maker_starter.start()
-        self.thing_maker.save_thing_maker()
-
-    def buy_thing(self):
-        self.shared_memory.reset_buy()
+        session.shared_memory.things = []
+        session.thing_maker_starter.start()
+        session.thing_maker.save_thing_maker()
+
+    def buy_thing(self, name=None, session=0):
+        # Whether the thing was bought. Under the command lock, so a refit of the prices doesn't write back the
+        # things from before the purchase
+        session = self.sessions[session]
+        with self._command_lock:
+            session.shared_memory.reset_buy()
+            if name is not None:
+                return session.thing_maker.buy_thing(name)
+
+    def reload_prices(self):
+        # The price parameters changed, the workers load them again and then the things with their new costs. Called
+        # by the refit thread, the things are read and written back without a purchase in between
+        with self._command_lock:
+            self.shared_memory.parameters_generation += 1
+
+            for session in self.sessions:
+                things = session.shared_memory.things
+                if not things:
+                    continue
+                for thing in things:
+                    if isinstance(thing, PotatoType):
+                        thing.quantity = thing.quantity
+                session.shared_memory.things = things
@@ -0,0 +1,29 @@
+from managers.thing_maker_starter import ThingMakerStarter
+
+
+class SimulationSession:
+    # Things, configuration and results of one account or scenario, searched by the workers the pool hands it
+    def __init__(self, slot, shared_memory, thing_maker, name=None):
+        self.slot = slot
+        self.name = name
+        self.shared_memory = shared_memory
+        self.thing_maker = thing_maker
+        self.thing_maker.shared_memory = shared_memory
+        self.thing_maker_starter = ThingMakerStarter(thing_maker)
+
+        self.running_simulation = False
+        # What its workers were last started with, every start is a new run
+        self.configuration = None
+        self.start_income = None
+        self.time_steps = None
+
+        # Share of the workers against the other running sessions, and the worker seconds it got for it
+        self.weight = 1
+        self.service = 0
+        self.workers = 0
+
+    def load_things(self):
+        # The starting things with the quantities of the save file
+        self.shared_memory.things = []
+        self.thing_maker_starter.start()
+        self.thing_maker.load_thing_maker()
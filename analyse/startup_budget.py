@@ -0,0 +1,51 @@
+import subprocess
+import sys
+import time
+
+# Seconds a fresh interpreter may take for each step, the slowest of the measured runs must stay under them
+BUDGETS = {
+    'import controller': ('import controller.controller', 0.6),
+    'import worker': ('import analyse.remote_workers', 0.4),
+    'import things': ('import managers.thing_maker_starter', 0.3),
+    'first simulation': ('import controller.controller as c; c.load_simulation()', 1.0),
+}
+
+# Modules that mustn't be imported by any of them
+HEAVY_MODULES = ('pandas', 'scipy', 'matplotlib')
+
+
+def measure(code, runs):
+    # Best time of runs fresh interpreters, which of the heavy modules they imported
+    check = f'import sys; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    times = []
+    imported = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', f'{code}; {check}'], capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        imported = output.stdout.strip().splitlines()[-1] if output.stdout.strip() else ''
+
+    return min(times), imported
+
+
+def check_budgets(runs):
+    # The interpreter alone, not counted against the budgets
+    baseline, _ = measure('pass', runs)
+    print(f'{"python":<18} {baseline:6.3f}s')
+
+    passed = True
+    for name, (code, budget) in BUDGETS.items():
+        elapsed, imported = measure(code, runs)
+        elapsed -= baseline
+        ok = elapsed <= budget and not imported
+        passed &= ok
+
+        heavy = f', imported {imported}' if imported else ''
+        print(f'{name:<18} {elapsed:6.3f}s of {budget:.3f}s {"ok" if ok else "OVER"}{heavy}')
+
+    return passed
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    sys.exit(0 if check_budgets(runs) else 1)
@@ -0,0 +1,99 @@
+import math
+
+from analyse.purchase_log import PurchaseLog
+from analyse.purchase_model import PurchaseModel
+
+
+class TreeNode:
+    def __init__(self, state, actions):
+        self.state = state
+        self.untried = actions
+        self.children = {}
+
+        self.visits = 0
+        self.total_income = 0.0
+
+
+class MonteCarloTreeSearch:
+    # Tree of purchase decisions from the current things, rolled out with the weighted rollout
+    def __init__(self, simulation, simulation_things, exploration=0.5, time_bucket=30, max_nodes=200000):
+        self.simulation = simulation
+        self.simulation_things = simulation_things
+        self.model = PurchaseModel(simulation_things, simulation.time_steps)
+        self.exploration = exploration
+        self.time_bucket = time_bucket
+        self.max_nodes = max_nodes
+
+        # Different purchase orders reaching the same quantities at about the same time share a node
+        self.transpositions = {}
+        self.best_income = 0
+
+        self._purchase_log = PurchaseLog(simulation.time_steps)
+        if simulation.engine == simulation.EVENT_ENGINE:
+            self._rollout = simulation.run_event_rollout
+        else:
+            self._rollout = simulation.run_rollout
+
+        self.root = self._node(self.model.initial_state())
+
+    def _key(self, state):
+        return state.things_state.quantities, state.time // self.time_bucket
+
+    def _node(self, state):
+        key = self._key(state)
+        node = self.transpositions.get(key)
+
+        if node is None:
+            node = TreeNode(state, self.model.actions(state))
+            self.transpositions[key] = node
+
+        return node
+
+    def _select(self, node):
+        log_visits = math.log(node.visits)
+        scale = self.best_income or 1
+
+        def score(child):
+            return child.total_income / child.visits / scale + self.exploration * math.sqrt(log_visits / child.visits)
+
+        return max(node.children.values(), key=score)
+
+    def iterate(self):
+        # Selection
+        node = self.root
+        path = [node]
+        while not node.untried and node.children:
+            node = self._select(node)
+            path.append(node)
+
+        # Expansion, actions that can't be afforded before the horizon are dropped
+        while node.untried and len(self.transpositions) < self.max_nodes:
+            action = node.untried.pop(0)
+            state = self.model.step(node.state, action)
+            if state is None:
+                continue
+
+            child = self._node(state)
+            node.children[action] = child
+            node = child
+            path.append(node)
+            break
+
+        # Simulation
+        income_per_second, purchase_log = self._rollout(self.simulation_things, self._purchase_log, node.state)
+        self.best_income = max(self.best_income, income_per_second)
+
+        # Backpropagation
+        for visited in path:
+            visited.visits += 1
+            visited.total_income += income_per_second
+
+        return income_per_second, purchase_log
+
+    def best_action(self):
+        # Most visited first purchase and its visit count
+        if not self.root.children:
+            return None, 0
+
+        action, child = max(self.root.children.items(), key=lambda item: item[1].visits)
+        return action, child.visits
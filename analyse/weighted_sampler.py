@@ -0,0 +1,84 @@
+from itertools import accumulate
+
+
+class WeightedSampler:
+    # Fenwick tree over the weights: O(log n) updates and draws
+    def __init__(self, size):
+        self._size = size
+        self._weights = [0.0] * size
+        self._tree = [0.0] * (size + 1)
+        self._positive = 0
+
+        self._top = 1
+        while self._top * 2 <= size:
+            self._top *= 2
+
+    def __len__(self):
+        return self._size
+
+    def reset(self, weights):
+        self._weights = [float(weight) for weight in weights]
+        self._positive = sum(weight > 0 for weight in self._weights)
+
+        # Linear build, every node passes its sum to its parent
+        self._tree = [0.0] + self._weights
+        for i in range(1, self._size + 1):
+            parent = i + (i & -i)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[i]
+
+    def weight(self, index):
+        return self._weights[index]
+
+    def update(self, index, weight):
+        old = self._weights[index]
+        if weight == old:
+            return
+
+        self._weights[index] = weight
+        self._positive += (weight > 0) - (old > 0)
+
+        delta = weight - old
+        i = index + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, count):
+        # Sum of the first count weights
+        total = 0.0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    @property
+    def total(self):
+        return self.prefix(self._size) if self._positive else 0.0
+
+    def find(self, value):
+        # Smallest index whose running sum goes past value
+        index = 0
+        step = self._top
+        while step:
+            if index + step <= self._size and self._tree[index + step] <= value:
+                index += step
+                value -= self._tree[index]
+            step //= 2
+        return index
+
+    def sample(self, u):
+        # u uniform in [0, 1), None when every weight is zero
+        if not self._positive:
+            return None
+
+        index = self.find(u * self.total)
+        if index < self._size and self._weights[index] > 0:
+            return index
+
+        # Rounding left the draw on a zero weight, fall back to a linear search
+        value = u * sum(self._weights)
+        for i, running in enumerate(accumulate(self._weights)):
+            if running > value and self._weights[i] > 0:
+                return i
+        return max(i for i, weight in enumerate(self._weights) if weight > 0)
@@ -1,76 +1,452 @@
+import json
+import re
+import time
+
 from analyse.predictor import Predictor
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
+from analyse.remote_workers import Coordinator
 from analyse.simulation import Simulation
+from controller.results_snapshot import ResultsSnapshot
 from managers.thing_maker import ThingMaker
 
 flask_app = Flask(__name__)
 
 thing_maker = ThingMaker()
-simulation = Simulation(thing_maker)
-thing_maker.shared_memory = simulation.shared_memory
+# Built on the first request that needs them, the shared memory starts a manager process
+simulation = None
+coordinator = None
+
+
+def load_simulation():
+    global simulation, coordinator
+    if simulation is None:
+        simulation = Simulation(thing_maker)
+        thing_maker.shared_memory = simulation.shared_memory
+        coordinator = Coordinator(simulation)
+        Predictor.parameter_listeners.append(simulation.reload_prices)
+    return simulation
+
+
+def load_coordinator():
+    load_simulation()
+    return coordinator
+
+
+# First parts of the routes of the default session, no session can be named like them
+RESERVED_SESSIONS = {"start", "end", "evaluate", "save", "results", "remote", "reset", "sessions"}
+
+
+def load_session(session_id, open_session=False):
+    # The session of that id or an error response, only starting one opens it
+    if session_id in RESERVED_SESSIONS or not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', session_id):
+        return None, (jsonify({"error": "Invalid session"}), 400)
+
+    if not open_session:
+        session = load_simulation().find_session(session_id)
+        if session is None:
+            return None, (jsonify({"error": "Unknown session"}), 404)
+        return session, None
+
+    session = load_simulation().open_session(session_id)
+    if session is None:
+        return None, (jsonify({"error": "No session left"}), 503)
+    return session, None
 
 
 @flask_app.route('/simulation/start', methods=['POST'])
 def start_simulation():
-    configuration = request.get_json()
+    return start_session(load_simulation().sessions[0])
+
+
+def start_session(session):
+    configuration = request.get_json(silent=True)
 
     if configuration is None:
         return jsonify({"error": "Invalid request"}), 400
 
     time_steps = configuration.get("time_steps", 900)
     start_income = configuration.get("start_income", None)
+    engine = configuration.get("engine", None)
+    planner = configuration.get("planner", None)
+    adaptive = configuration.get("adaptive", None)
+    # Carry on from the last checkpoint if it searched the same things
+    resume = configuration.get("resume", False)
+    # Share of the workers against the other running sessions
+    weight = configuration.get("weight", None)
+    if weight is not None and (not isinstance(weight, (int, float)) or weight <= 0):
+        return jsonify({"error": "Invalid weight"}), 400
 
     # Run the simulation
-    if not simulation.start_simulation(start_income, time_steps):
+    if not load_simulation().start_simulation(start_income, time_steps, engine, planner, adaptive, resume=resume,
+                                              session=session.slot, weight=weight):
         return jsonify({"error": "Simulation already running"}), 400
 
-    return jsonify("Simulation started")
+    return jsonify("Simulation resumed" if session.slot == 0 and simulation.resumed else "Simulation started")
 
 
 @flask_app.route('/simulation/end', methods=['POST'])
 def end_simulation():
-    simulation.end_simulation()
+    load_simulation().end_simulation()
     return jsonify({"message": "Simulation ended"})
 
 
+def parse_purchase(purchase):
+    # A thing name, [name, second] or {"thing": name, "time": second}, bought as soon as affordable but not before second
+    if isinstance(purchase, str):
+        return purchase, None
+    if isinstance(purchase, dict):
+        name, at = purchase["thing"], purchase.get("time")
+    else:
+        name, at = purchase
+
+    if not isinstance(name, str):
+        raise ValueError
+    return name, None if at is None else int(at)
+
+
+@flask_app.route('/simulation/evaluate', methods=['POST'])
+def evaluate_plans():
+    return evaluate_session(load_simulation().sessions[0])
+
+
+def evaluate_session(session):
+    # {"plans": [[purchase, ...], ...], "time_steps": 900, "log": true}, the results in the order of the plans
+    configuration = request.get_json(silent=True)
+    if isinstance(configuration, list):
+        configuration = {"plans": configuration}
+
+    if not isinstance(configuration, dict) or not isinstance(configuration.get("plans"), list):
+        return jsonify({"error": "Invalid request"}), 400
+
+    simulation = load_simulation()
+    try:
+        plans = [[parse_purchase(purchase) for purchase in plan] for plan in configuration["plans"]]
+        time_steps = int(configuration.get("time_steps") or session.time_steps or 900)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Invalid plan"}), 400
+
+    try:
+        results = simulation.evaluate(plans, time_steps, bool(configuration.get("log", True)), session.slot)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify(results)
+
+
 @flask_app.route('/simulation/save', methods=['POST'])
 def save_simulation():
-    simulation.save_simulation()
+    load_simulation().save_simulation()
     return jsonify({"message": "Simulation saved"})
 
 
+def build_results(slot):
+    session = load_simulation().sessions[slot]
+    results = session.shared_memory.to_dict()
+    # Workers of the pool searching it now
+    results["workers"] = session.workers
+    results["weight"] = session.weight
+    if slot == 0:
+        results["remote_workers"] = len(load_coordinator().workers)
+    return results
+
+
+# Every results route of a session reads the same snapshot instead of building its own
+results_snapshots = {}
+# Results moving with the clock alone, a running search changes the others too
+VOLATILE_RESULTS = ("time_elapsed", "simulations_per_second", "simulation_time")
+
+
+def results_snapshot(slot):
+    if slot not in results_snapshots:
+        results_snapshots[slot] = ResultsSnapshot(lambda: build_results(slot), volatile=VOLATILE_RESULTS)
+    return results_snapshots[slot]
+
+
+def etag_matches(if_none_match, etag):
+    # An If-None-Match header lists tags separated by commas, weak ones prefixed by W/, or is *
+    if not if_none_match:
+        return False
+
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def results_response(snapshot):
+    _, body, etag = snapshot
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers={"ETag": etag})
+    return Response(body, mimetype="application/json", headers={"ETag": etag})
+
+
 @flask_app.route('/simulation/results', methods=['GET'])
 def get_simulation():
-    return jsonify(simulation.get_simulation_results().to_dict())
+    return results_response(results_snapshot(0).get())
+
+
+@flask_app.route('/simulation/results/poll', methods=['GET'])
+def poll_simulation():
+    return poll_session(0)
+
+
+def poll_session(slot):
+    # Answers once the results differ from the ETag sent, 304 if they didn't within timeout seconds
+    sent = request.headers.get("If-None-Match") or request.args.get("etag")
+    timeout = min(request.args.get("timeout", 30, type=float), 120)
+
+    snapshots = results_snapshot(slot)
+    snapshot = snapshots.get()
+    if etag_matches(sent, snapshot[2]):
+        etag = snapshot[2]
+        snapshot = snapshots.wait(etag, timeout)
+        if snapshot is None:
+            return Response(status=304, headers={"ETag": etag})
+    return results_response(snapshot)
+
+
+@flask_app.route('/simulation/results/stream', methods=['GET'])
+def stream_simulation():
+    return stream_session(0)
+
+
+def stream_session(slot):
+    # Server-sent events, all the results first and then only the ones that changed
+    snapshots = results_snapshot(slot)
+
+    def events():
+        results, etag = None, None
+        while True:
+            snapshot = snapshots.wait(etag, 15)
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+                continue
+
+            event = "results" if results is None else "delta"
+            yield f"event: {event}\nid: {snapshot[2]}\ndata: {json.dumps(ResultsSnapshot.delta(results, snapshot[0]))}\n\n"
+            results, _, etag = snapshot
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@flask_app.route('/simulation/remote/start', methods=['POST'])
+def start_coordinator():
+    configuration = request.get_json(silent=True) or {}
+    host = configuration.get("host", "localhost")
+    port = configuration.get("port", 6000)
+
+    try:
+        started = load_coordinator().start((host, port), configuration.get("authkey"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not started:
+        return jsonify({"error": "Coordinator already running"}), 400
+
+    return jsonify({"message": f"Waiting for workers on {host}:{port}"})
+
+
+@flask_app.route('/simulation/remote/end', methods=['POST'])
+def end_coordinator():
+    load_coordinator().close()
+    return jsonify({"message": "Coordinator closed"})
+
+
+@flask_app.route('/simulation/remote', methods=['GET'])
+def get_remote_workers():
+    return jsonify([{"slot": slot, "address": list(address)} for slot, address in load_coordinator().workers.items()])
 
 
 @flask_app.route('/simulation/reset', methods=['GET'])
 def reset_simulation():
-    simulation.reset_simulation()
+    load_simulation().reset_simulation()
     return jsonify({"message": "Simulation reset"})
 
 @flask_app.route('/thing_maker/buy/<thing_name>', methods=['GET'])
 def buy_thing(thing_name):
+    return buy_session_thing(load_simulation().sessions[0], thing_name)
+
+
+def buy_session_thing(session, thing_name):
     if thing_name is None:
         return jsonify({"error": "Missing thing name"}), 400
 
-    simulation.buy_thing()
-    thing_maker.buy_thing(thing_name)
+    load_simulation().buy_thing(thing_name, session.slot)
 
     return jsonify("Thing bought")
 
 
 @flask_app.route('/thing_maker/buyable', methods=['GET'])
 def get_buyable_things():
+    load_simulation()
     return jsonify(thing_maker.get_buyable_things())
 
 
+@flask_app.route('/planner/next', methods=['GET'])
+def next_purchase():
+    # Best thing to buy now found within deadline_ms, of the default session or the one named session
+    deadline = time.monotonic() + min(request.args.get("deadline_ms", 100, type=float), 10000) / 1000
+    time_steps = request.args.get("time_steps", None, type=int)
+
+    session = load_simulation().sessions[0]
+    if "session" in request.args:
+        session, error = load_session(request.args["session"])
+        if error:
+            return error
+
+    suggestion = simulation.next_purchase(deadline, time_steps, session.slot)
+    if suggestion is None:
+        return jsonify({"error": "Nothing can be bought"}), 404
+    return jsonify(suggestion)
+
+
+@flask_app.route('/simulation/sessions', methods=['GET'])
+def get_sessions():
+    # Every open session and how fast it's searched
+    sessions = []
+    for session in load_simulation().sessions:
+        if session.name is None:
+            continue
+        results = session.shared_memory.to_dict()
+        sessions.append({
+            "session": session.name,
+            "running": session.running_simulation,
+            "weight": session.weight,
+            "workers": session.workers,
+            "simulation_index": results["simulation_index"],
+            "simulations_per_second": results["simulations_per_second"],
+            "best_income": results["best_income"]
+        })
+    return jsonify(sessions)
+
+
+@flask_app.route('/simulation/<session_id>/start', methods=['POST'])
+def start_named_session(session_id):
+    session, error = load_session(session_id, open_session=True)
+    return error or start_session(session)
+
+
+@flask_app.route('/simulation/<session_id>/end', methods=['POST'])
+def end_named_session(session_id):
+    session, error = load_session(session_id)
+    if error:
+        return error
+
+    simulation.end_simulation(session=session.slot)
+    return jsonify({"message": "Simulation ended"})
+
+
+@flask_app.route('/simulation/<session_id>/evaluate', methods=['POST'])
+def evaluate_named_session(session_id):
+    session, error = load_session(session_id)
+    return error or evaluate_session(session)
+
+
+@flask_app.route('/simulation/<session_id>/save', methods=['POST'])
+def save_named_session(session_id):
+    session, error = load_session(session_id)
+    if error:
+        return error
+
+    simulation.save_simulation(session.slot)
+    return jsonify({"message": "Simulation saved"})
+
+
+@flask_app.route('/simulation/<session_id>/reset', methods=['GET'])
+def reset_named_session(session_id):
+    session, error = load_session(session_id)
+    if error:
+        return error
+
+    simulation.reset_simulation(session.slot)
+    return jsonify({"message": "Simulation reset"})
+
+
+@flask_app.route('/simulation/<session_id>/results', methods=['GET'])
+def get_named_session(session_id):
+    session, error = load_session(session_id)
+    return error or results_response(results_snapshot(session.slot).get())
+
+
+@flask_app.route('/simulation/<session_id>/results/poll', methods=['GET'])
+def poll_named_session(session_id):
+    session, error = load_session(session_id)
+    return error or poll_session(session.slot)
+
+
+@flask_app.route('/simulation/<session_id>/results/stream', methods=['GET'])
+def stream_named_session(session_id):
+    session, error = load_session(session_id)
+    return error or stream_session(session.slot)
+
+
+@flask_app.route('/simulation/<session_id>/buy/<thing_name>', methods=['GET'])
+def buy_named_session_thing(session_id, thing_name):
+    session, error = load_session(session_id)
+    return error or buy_session_thing(session, thing_name)
+
+
+@flask_app.route('/simulation/<session_id>/buyable', methods=['GET'])
+def get_named_session_buyable(session_id):
+    session, error = load_session(session_id)
+    if error:
+        return error
+
+    if not session.shared_memory.catalog:
+        session.load_things()
+    return jsonify(session.thing_maker.get_buyable_things())
+
+
+@flask_app.route('/simulation/<session_id>', methods=['DELETE'])
+def close_named_session(session_id):
+    # Ends it and frees its slot for another session, the default one stays
+    session, error = load_session(session_id)
+    if error:
+        return error
+    if session.slot == 0:
+        return jsonify({"error": "The default session can't be closed"}), 400
+
+    simulation.close_session(session)
+    if session.slot in results_snapshots:
+        results_snapshots.pop(session.slot).close()
+    return jsonify({"message": "Session closed"})
+
+
 @flask_app.route('/predictor/thing_price/<thing_name>/<price>', methods=['GET'])
 def predict_price(thing_name, price):
     Predictor.add_price_evolution(thing_name, price)
     return jsonify("Price added")
 
+@flask_app.route('/predictor/thing_price', methods=['POST'])
+def add_prices():
+    # [{"thing": name, "quantity": q, "price": p}, ...], the price of the q-th one, the next one without a quantity
+    observations = request.get_json(silent=True)
+    if isinstance(observations, dict):
+        observations = observations.get("prices")
+
+    if not isinstance(observations, list) or not observations:
+        return jsonify({"error": "Invalid request"}), 400
+
+    try:
+        prices = []
+        for observation in observations:
+            quantity = observation.get("quantity")
+            price = int(observation["price"])
+            if quantity is not None:
+                quantity = int(quantity)
+            if not isinstance(observation["thing"], str) or price <= 0 or (quantity is not None and quantity < 1):
+                raise ValueError
+            prices.append((observation["thing"], quantity, price))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return jsonify({"error": "Invalid price"}), 400
+
+    Predictor.add_prices(prices)
+    return jsonify({"message": f"{len(prices)} prices added"})
+
+
 @flask_app.route('/predictor/thing_price', methods=['GET'])
 def get_thing_price():
     return jsonify(Predictor.get_thing_price())
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class ResultsSnapshot:
+    # Results built by a thread of its own at most every interval seconds, and only while someone asked for them in
+    # the last idle seconds. Every reader gets the same results, their JSON body and the ETag naming it. Results
+    # differing only in the volatile entries, derived from the clock, are not new ones
+    def __init__(self, build, interval=0.25, idle=10, volatile=()):
+        self.build = build
+        self.interval = interval
+        self.idle = idle
+        self.volatile = volatile
+
+        self._changed = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+        self._asked_at = 0
+        self._snapshot = None
+        # JSON of the results without the volatile entries, what the ETag is hashed from
+        self._state = None
+
+    def get(self):
+        # (results, body, ETag) of the last snapshot, the first one is built right away
+        self._asked_at = time.monotonic()
+        with self._start_lock:
+            if self._thread is None:
+                self._update()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self._snapshot
+
+    def wait(self, etag, timeout):
+        # The first snapshot with another ETag, None if there was none before timeout
+        self.get()
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._snapshot[2] == etag:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # Waiting counts as asking, the snapshot keeps being built
+                self._asked_at = time.monotonic()
+                self._changed.wait(min(remaining, self.idle / 2))
+            return self._snapshot
+
+    def close(self):
+        # The thread stops, readers keep the last snapshot
+        self._closed.set()
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            if time.monotonic() - self._asked_at > self.idle:
+                continue
+
+            try:
+                self._update()
+            except Exception as e:
+                print(f"Results not updated: {e}")
+
+    def _update(self):
+        results = self.build()
+        state = json.dumps({key: value for key, value in results.items() if key not in self.volatile})
+
+        with self._changed:
+            if self._snapshot is not None and state == self._state:
+                return
+            etag = '"' + hashlib.sha1(state.encode()).hexdigest()[:16] + '"'
+            self._state = state
+            self._snapshot = results, json.dumps(results), etag
+            self._changed.notify_all()
+
+    @staticmethod
+    def delta(old, new):
+        # Entries of new that changed since old
+        if old is None:
+            return new
+        return {key: value for key, value in new.items() if old.get(key) != value}
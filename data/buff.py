@@ -1,11 +1,10 @@
 class Buff:
+    __slots__ = ('name', 'duration', 'value')
+
     def __init__(self, name, duration, value):
         self.name = name
         self.duration = duration
         self.value = value
 
-    def use(self):
-        self.duration -= 1
-        if self.duration == 0:
-            return -self.value
-        return 0
+    def copy(self):
+        return Buff(self.name, self.duration, self.value)
@@ -1,109 +1,349 @@
+import ctypes
+import math
 import multiprocessing
 import pickle
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
+from multiprocessing.sharedctypes import RawArray, RawValue
 
+from data.thing_table import ThingTable
 from data.things.upgrade import Upgrade
-from managers.thing_maker import ThingMaker
 
 
 class SharedMemory:
-    def __init__(self, thread_count):
+    # Reads of a slot or the catalog while it is written, about a millisecond apart, before giving up on the writer
+    SEQUENCE_RETRIES = 1000
+
+    def __init__(self, thread_count, flush_interval=16, catalog_capacity=1 << 20, log_capacity=1 << 18,
+                 remote_slots=0, manager=None):
         # Use self.manager to share the values across processes
         self._things = []
 
         self._thread_count = thread_count
-        manager = multiprocessing.Manager()
+        # Local workers use the first slots, the workers of other machines the remote_slots after them
+        slots = thread_count + remote_slots
+        # Sessions share the manager of the first one
+        if manager is None:
+            manager = multiprocessing.Manager()
+        self.manager = manager
+
+        # Best rollout of every worker, written only by it under a sequence number that is odd while it writes,
+        # the best of all is the best slot
+        self._best_income = RawArray('d', slots)
+        self._best_index = RawArray('q', [-1] * slots)
+        self._best_sequence = RawArray('q', slots)
+        self._best_log_size = RawArray('q', slots)
+        self._best_logs = RawArray('B', slots * log_capacity)
+        self._log_capacity = log_capacity
 
         # Shared variables for inter-process communication
-        self._best_income = manager.Value('d', 0.0)
-        self._best_log = manager.list()
-        self._best_index = manager.Value('i', -1)
+        # Highest income any plan can reach, published by the branch and bound planner
+        self._upper_bound = manager.Value('d', math.inf)
+
+        # Cross entropy sampling: elites sent by the workers and the biases they produced
+        self._elite_submissions = manager.list()
+        self._biases = manager.list()
+        self._bias_generation = manager.Value('i', 0)
 
         self.start_time = datetime.now()
+        # When the run ended, its elapsed time stops there
+        self.end_time = None
+
+        # Counters without a lock, one slot per worker and only written by it, inherited by the forked workers
+        self._total_income = RawArray('d', slots)
+        self._simulation_index = RawArray('q', slots)
+        self._simulation_index_since_last_thing = RawArray('q', slots)
+        self._pruned_rollouts = RawArray('q', slots)
+        self._pruned_steps = RawArray('q', slots)
+
+        # Buying a thing starts a new generation, the slots written in an older one don't count for the averages
+        self._buy_generation = RawValue('q', 0)
+        self._slot_generation = RawArray('q', slots)
 
-        # Shared arrays
-        self._total_income = manager.list([0] * thread_count)
-        self._simulation_index = manager.list([0] * thread_count)
-        self._simulation_index_since_last_thing = manager.list([0] * thread_count)
+        # What this process counted since it last wrote its slot, written every flush_interval rollouts
+        self.flush_interval = flush_interval
+        self._pending = [0, 0, 0.0, 0, 0]
+        self._pending_generation = 0
 
-        self._shared_memory_file = "resource/shared/shared_things.pickle"
+        # The pickled things, published under a generation that is odd while they're being written
+        self._catalog_buffer = RawArray('B', catalog_capacity)
+        self._catalog_size = RawValue('q', 0)
+        self._catalog_generation = RawValue('q', 0)
+        self._publish_lock = threading.Lock()
+
+        # Changes whenever the price parameters are fitted again
+        self._parameters_generation = RawValue('q', 0)
+
+        # Last generation this process read, decoded only when asked for
+        self._catalog_read = -1
+        self._catalog_bytes = None
+        self._catalog = None
+        self._thing_table = None
 
         self.things = []
 
-    def increase_simulation(self, thread_id, income):
-        self._simulation_index[thread_id] += 1
-        self._simulation_index_since_last_thing[thread_id] += 1
-        self._total_income[thread_id] += income
+    def increase_simulation(self, thread_id, income, count=1):
+        pending = self._pending_for_generation()
+        pending[0] += count
+        pending[1] += count
+        pending[2] += income
+
+        if pending[0] + pending[3] >= self.flush_interval:
+            self.flush(thread_id)
+
+    def increase_pruned(self, thread_id, steps):
+        # Rollouts abandoned because they couldn't beat the best income, and the seconds not simulated
+        pending = self._pending_for_generation()
+        pending[3] += 1
+        pending[4] += steps
+
+        if pending[0] + pending[3] >= self.flush_interval:
+            self.flush(thread_id)
+
+    def _pending_for_generation(self):
+        # Rollouts of things that were bought since don't count for the average income
+        generation = self._buy_generation.value
+        if generation != self._pending_generation:
+            self._pending[1] = 0
+            self._pending[2] = 0.0
+            self._pending_generation = generation
+        return self._pending
+
+    def flush(self, thread_id):
+        rollouts, since_last_thing, income, pruned_rollouts, pruned_steps = self._pending_for_generation()
+
+        self._simulation_index[thread_id] += rollouts
+        self._pruned_rollouts[thread_id] += pruned_rollouts
+        self._pruned_steps[thread_id] += pruned_steps
+        if self._slot_generation[thread_id] == self._pending_generation:
+            self._simulation_index_since_last_thing[thread_id] += since_last_thing
+            self._total_income[thread_id] += income
+        else:
+            self._simulation_index_since_last_thing[thread_id] = since_last_thing
+            self._total_income[thread_id] = income
+            self._slot_generation[thread_id] = self._pending_generation
+
+        self._pending[:] = [0, 0, 0.0, 0, 0]
+
+    def set_counts(self, thread_id, rollouts, since_last_thing, income, pruned_rollouts, pruned_steps):
+        # Totals of a worker on another machine, written by the one thread receiving them
+        self._simulation_index[thread_id] = rollouts
+        self._pruned_rollouts[thread_id] = pruned_rollouts
+        self._pruned_steps[thread_id] = pruned_steps
+        self._simulation_index_since_last_thing[thread_id] = since_last_thing
+        self._total_income[thread_id] = income
+        self._slot_generation[thread_id] = self._buy_generation.value
+
+    def rollout_index(self, thread_id):
+        # Rollouts of this worker, counting the ones not written yet
+        return self._simulation_index[thread_id] + self._pending[0]
+
+    def submit_elites(self, submission):
+        self._elite_submissions.append(submission)
+
+    def take_elites(self):
+        submissions = list(self._elite_submissions)
+        # Only the ones read, workers may have appended meanwhile
+        del self._elite_submissions[:len(submissions)]
+        return submissions
+
+    def publish_best(self, thread_id, income, index, log):
+        data = pickle.dumps(log)
+        if len(data) > self._log_capacity:
+            print(f"Best log of {len(data)} bytes doesn't fit in {self._log_capacity}, publishing it empty")
+            data = pickle.dumps([])
+
+        self._best_sequence[thread_id] += 1
+        ctypes.memmove(ctypes.addressof(self._best_logs) + thread_id * self._log_capacity, data, len(data))
+        self._best_log_size[thread_id] = len(data)
+        self._best_index[thread_id] = index
+        self._best_income[thread_id] = income
+        self._best_sequence[thread_id] += 1
+
+    def best(self):
+        # Income, index and log of the best slot, read again if its worker published meanwhile. A slot still written
+        # after SEQUENCE_RETRIES reads is of a worker that stopped while publishing, and is left out
+        slots = list(range(len(self._best_income)))
+        retries = 0
+        while slots:
+            thread_id = max(slots, key=self._best_income.__getitem__)
+            sequence = self._best_sequence[thread_id]
+            if sequence % 2:
+                retries += 1
+                if retries >= self.SEQUENCE_RETRIES:
+                    slots.remove(thread_id)
+                    retries = 0
+                time.sleep(0.001)
+                continue
+
+            income = self._best_income[thread_id]
+            index = self._best_index[thread_id]
+            size = self._best_log_size[thread_id]
+            data = ctypes.string_at(ctypes.addressof(self._best_logs) + thread_id * self._log_capacity, size)
+
+            if self._best_sequence[thread_id] == sequence:
+                return income, index, pickle.loads(data) if size else []
+
+        return 0, -1, []
+
+    def release(self, thread_id):
+        # The worker of the slot was stopped, a best it was publishing meanwhile is dropped
+        if self._best_sequence[thread_id] % 2:
+            self._best_income[thread_id] = 0
+            self._best_index[thread_id] = -1
+            self._best_log_size[thread_id] = 0
+            self._best_sequence[thread_id] += 1
 
     @property
     def best_income(self):
-        return self._best_income.value
+        return max(self._best_income)
 
     @property
     def best_log(self):
-        return self._best_log
+        return self.best()[2]
 
     @property
     def best_index(self):
-        return self._best_index.value
+        return self.best()[1]
+
+    @property
+    def upper_bound(self):
+        return self._upper_bound.value
+
+    @property
+    def biases(self):
+        return list(self._biases)
+
+    @property
+    def bias_generation(self):
+        return self._bias_generation.value
 
     @property
     def things(self):
-        # read from file
-        try:
-            with open(self._shared_memory_file, "rb") as f:
-                things = pickle.load(f)
-                for thing in things:
-                    if isinstance(thing, Upgrade):
-                        thing.thing_maker.shared_memory = self
-                        thing.thing_maker.simulation_things = things
+        # A copy of its own for the caller to change
+        self._refresh_catalog()
+        return self._decode(self._catalog_bytes)
+
+    @property
+    def catalog(self):
+        # Read only copy shared by every reader of this process
+        self._refresh_catalog()
+        if self._catalog is None:
+            self._catalog = self._decode(self._catalog_bytes)
+        return self._catalog
+
+    @property
+    def thing_table(self):
+        # Columns and name index of the catalog, for lookups that don't need the things themselves
+        self._refresh_catalog()
+        if self._thing_table is None:
+            self._thing_table = ThingTable(self.catalog)
+        return self._thing_table
+
+    @property
+    def catalog_bytes(self):
+        # Generation and pickled things, to send them elsewhere
+        self._refresh_catalog()
+        return self._catalog_read, self._catalog_bytes
+
+    @property
+    def parameters_generation(self):
+        return self._parameters_generation.value
 
-                return things
-        except FileNotFoundError:
-            return []
+    @parameters_generation.setter
+    def parameters_generation(self, value):
+        self._parameters_generation.value = value
+
+    @property
+    def things_generation(self):
+        # Changes whenever other things are published
+        return self._catalog_generation.value
+
+    def _refresh_catalog(self):
+        if self._catalog_generation.value == self._catalog_read:
+            return
+
+        for _ in range(self.SEQUENCE_RETRIES):
+            generation = self._catalog_generation.value
+            if generation % 2:
+                time.sleep(0.001)
+                continue
+
+            data = ctypes.string_at(self._catalog_buffer, self._catalog_size.value)
+            # Read again if it was published meanwhile
+            if self._catalog_generation.value == generation:
+                break
+        else:
+            raise RuntimeError("Things are still being published, the process publishing them stopped")
+
+        self._catalog_read = generation
+        self._catalog_bytes = data
+        self._catalog = None
+        self._thing_table = None
+
+    def _decode(self, data):
+        things = pickle.loads(data)
+        for thing in things:
+            if isinstance(thing, Upgrade):
+                thing.thing_maker.shared_memory = self
+                thing.thing_maker.simulation_things = things
+
+        return things
 
     @property
     def total_income(self):
-        return self._total_income
+        return self._current(self._total_income)
 
     @property
     def simulation_index(self):
-        return self._simulation_index
+        return list(self._simulation_index)
 
     @property
     def simulation_index_since_last_thing(self):
-        return self._simulation_index_since_last_thing
+        return self._current(self._simulation_index_since_last_thing)
+
+    @property
+    def pruned_rollouts(self):
+        return list(self._pruned_rollouts)
+
+    @property
+    def pruned_steps(self):
+        return list(self._pruned_steps)
 
-    @best_income.setter
-    def best_income(self, value):
-        self._best_income.value = value
+    def _current(self, slots):
+        # Slots of the workers that wrote since the last thing was bought
+        generation = self._buy_generation.value
+        return [value if slot_generation == generation else 0 for value, slot_generation in zip(slots, self._slot_generation)]
 
-    @best_log.setter
-    def best_log(self, value):
-        self._best_log[:] = value
+    @upper_bound.setter
+    def upper_bound(self, value):
+        self._upper_bound.value = value
 
-    @best_index.setter
-    def best_index(self, value):
-        self._best_index.value = value
+    @biases.setter
+    def biases(self, value):
+        self._biases[:] = value
+
+    @bias_generation.setter
+    def bias_generation(self, value):
+        self._bias_generation.value = value
 
     @things.setter
     def things(self, value):
-        # write in file pickle
-        with open(self._shared_memory_file, "wb") as f:
-            pickle.dump(value, f)
-
-    @simulation_index_since_last_thing.setter
-    def simulation_index_since_last_thing(self, value):
-        self._simulation_index_since_last_thing[:] = value
+        data = pickle.dumps(value)
+        if len(data) > len(self._catalog_buffer):
+            raise ValueError(f"Things take {len(data)} bytes, more than the {len(self._catalog_buffer)} reserved")
 
-    @total_income.setter
-    def total_income(self, value):
-        self._total_income[:] = value
+        with self._publish_lock:
+            self._catalog_generation.value += 1
+            ctypes.memmove(self._catalog_buffer, data, len(data))
+            self._catalog_size.value = len(data)
+            self._catalog_generation.value += 1
 
     def to_dict(self):
         total_income_sum = sum(self.total_income)
         simulation_index_sum = sum(self.simulation_index)
-        simulation_index_since_last_thing_sum = sum(self._simulation_index_since_last_thing)
+        simulation_index_since_last_thing_sum = sum(self.simulation_index_since_last_thing)
 
         if simulation_index_sum == 0 or simulation_index_since_last_thing_sum == 0 or not self.start_time:
             return {
@@ -115,21 +355,107 @@ class SharedMemory:
                 "time_elapsed": 0,
                 "simulations_per_second": 0,
                 "simulation_time": 0,
-                "current_income": 0
+                "current_income": 0,
+                "upper_bound": None,
+                "optimality_gap": None,
+                "biases": {},
+                "bias_generation": 0,
+                "pruned_rollouts": sum(self.pruned_rollouts),
+                "pruned_steps": sum(self.pruned_steps)
             }
-        elapsed_time = datetime.now() - self.start_time
+        elapsed_time = self.elapsed_time
+        things = self.catalog
+        best_income, best_index, best_log = self.best()
         return {
-            "best_income": self.best_income,
-            "best_log": list(self.best_log),
-            "best_index": self.best_index,
+            "best_income": best_income,
+            "best_log": best_log,
+            "best_index": best_index,
             "simulation_index": simulation_index_sum,
             "average_income": total_income_sum / simulation_index_since_last_thing_sum,
-            "time_elapsed": elapsed_time.total_seconds(),
-            "simulations_per_second": simulation_index_sum / elapsed_time.total_seconds(),
-            "simulation_time": elapsed_time.total_seconds() / simulation_index_sum * self._thread_count,
-            "current_income": ThingMaker.current_income(self.things)
+            "time_elapsed": elapsed_time,
+            "simulations_per_second": simulation_index_sum / elapsed_time,
+            "simulation_time": elapsed_time / simulation_index_sum * self._thread_count,
+            "current_income": self.thing_table.income(),
+            "upper_bound": self.upper_bound if math.isfinite(self.upper_bound) else None,
+            "optimality_gap": self.optimality_gap,
+            "biases": self._bias_table([thing.name for thing in things]),
+            "bias_generation": self.bias_generation,
+            "pruned_rollouts": sum(self.pruned_rollouts),
+            "pruned_steps": sum(self.pruned_steps)
         }
 
+    def _bias_table(self, names):
+        # Bias of every thing per time bucket
+        biases = self.biases
+        if not biases:
+            return {}
+        return {name: [row[i] for row in biases] for i, name in enumerate(names)}
+
+    @property
+    def elapsed_time(self):
+        # Seconds the run searched, until it ended
+        return ((self.end_time or datetime.now()) - self.start_time).total_seconds()
+
+    def stop_clock(self):
+        self.end_time = datetime.now()
+
+    @property
+    def optimality_gap(self):
+        if not math.isfinite(self.upper_bound) or self.upper_bound <= 0:
+            return None
+        return max(self.upper_bound - self.best_income, 0) / self.upper_bound
+
+    def reset_run(self):
+        # Only while the workers are paused, otherwise they are the only ones writing their slots
+        for slots in (self._total_income, self._simulation_index, self._simulation_index_since_last_thing,
+                      self._pruned_rollouts, self._pruned_steps, self._best_income, self._best_sequence,
+                      self._best_log_size):
+            ctypes.memset(slots, 0, ctypes.sizeof(slots))
+        self._best_index[:] = [-1] * len(self._best_index)
+
+        self._elite_submissions[:] = []
+        self.biases = []
+        self.bias_generation = 0
+        self.upper_bound = math.inf
+        self.start_time = datetime.now()
+        self.end_time = None
+
+    def snapshot(self):
+        # Totals of every slot, without what the workers haven't written yet
+        best_income, best_index, best_log = self.best()
+        return {
+            "simulation_index": sum(self.simulation_index),
+            "simulation_index_since_last_thing": sum(self.simulation_index_since_last_thing),
+            "total_income": sum(self.total_income),
+            "pruned_rollouts": sum(self.pruned_rollouts),
+            "pruned_steps": sum(self.pruned_steps),
+            "best": (best_income, best_index, best_log),
+            "biases": self.biases,
+            "bias_generation": self.bias_generation,
+            "upper_bound": self.upper_bound,
+            "time_elapsed": self.elapsed_time
+        }
+
+    def restore(self, snapshot):
+        # Only while the workers are paused, right after reset_run, the totals go to the first slot
+        self._simulation_index[0] = snapshot["simulation_index"]
+        self._simulation_index_since_last_thing[0] = snapshot["simulation_index_since_last_thing"]
+        self._total_income[0] = snapshot["total_income"]
+        self._pruned_rollouts[0] = snapshot["pruned_rollouts"]
+        self._pruned_steps[0] = snapshot["pruned_steps"]
+        self._slot_generation[0] = self._buy_generation.value
+
+        best_income, best_index, best_log = snapshot["best"]
+        if best_income > 0:
+            self.publish_best(0, best_income, best_index, best_log)
+
+        self.biases = snapshot["biases"]
+        self.bias_generation = snapshot["bias_generation"]
+        self.upper_bound = snapshot["upper_bound"]
+        self.start_time = datetime.now() - timedelta(seconds=snapshot["time_elapsed"])
+        self.end_time = None
+
     def reset_buy(self):
-        self.simulation_index_since_last_thing = [0] * len(self._simulation_index_since_last_thing)
-        self.total_income = [0] * len(self._total_income)
+        # The workers start their slots over on their next write
+        self._buy_generation.value += 1
+        self.upper_bound = math.inf
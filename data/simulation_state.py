@@ -0,0 +1,18 @@
+class SimulationState:
+    def __init__(self, states):
+        self._states = states
+
+    @classmethod
+    def capture(cls, things):
+        return cls([thing.get_state() for thing in things])
+
+    def restore(self, things):
+        for thing, state in zip(things, self._states):
+            thing.set_state(state)
+
+    def copy(self):
+        return SimulationState(list(self._states))
+
+    @property
+    def quantities(self):
+        return tuple(state[0] for state in self._states)
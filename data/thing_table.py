@@ -0,0 +1,68 @@
+import numpy as np
+
+from data.things.probetato import Probetato
+from data.things.upgrade import Upgrade
+
+
+class ThingTable:
+    # The things as columns, one row per thing in catalog order, and the row of every name
+    POTATO_TYPE = 0
+    PROBETATO = 1
+    UPGRADE = 2
+
+    def __init__(self, things):
+        count = len(things)
+        self.names = [thing.name for thing in things]
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        self.kind = np.zeros(count, dtype=np.int8)
+        self.base_power = np.zeros(count)
+        # Row of the thing an upgrade multiplies and by how much, -1 and 1 for the others
+        self.target = np.full(count, -1, dtype=np.int64)
+        self.upgrade_multiplier = np.ones(count)
+        self.buff_duration = np.zeros(count, dtype=np.int64)
+        self.buff_value = np.zeros(count)
+
+        # Changed by buying, see _refresh
+        self.quantity = np.zeros(count, dtype=np.int64)
+        self.multiplier = np.ones(count)
+        self.current_cost = np.zeros(count)
+        self.efficiency = np.zeros(count)
+
+        for i, thing in enumerate(things):
+            if isinstance(thing, Upgrade):
+                self.kind[i] = self.UPGRADE
+                self.target[i] = self.index[thing.target]
+                self.upgrade_multiplier[i] = thing.multiplier
+                continue
+
+            self.kind[i] = self.PROBETATO if isinstance(thing, Probetato) else self.POTATO_TYPE
+            self.base_power[i] = thing.base_power_output
+
+            if thing.buff is not None:
+                self.buff_duration[i] = thing.buff.duration
+                self.buff_value[i] = thing.buff.value
+
+        self.upgrades = np.flatnonzero(self.kind == self.UPGRADE)
+        self._refresh(things)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _refresh(self, things):
+        for i, thing in enumerate(things):
+            self.quantity[i] = thing.quantity
+            self.current_cost[i] = thing.current_cost
+
+            if self.kind[i] != self.UPGRADE:
+                self.multiplier[i] = thing.multiplier
+                self.efficiency[i] = thing.efficiency
+
+    @property
+    def power(self):
+        return self.base_power * self.multiplier
+
+    def income(self):
+        # Income per second of everything owned, the first three probetatos produce nothing
+        owned = np.where(self.kind == self.PROBETATO, np.maximum(self.quantity - 3, 0), self.quantity)
+        return float(np.sum(np.where(self.kind == self.UPGRADE, 0, self.power * owned)))
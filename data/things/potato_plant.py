@@ -4,6 +4,8 @@ from data.things.potato_types import PotatoType
 
 
 class PotatoPlant(PotatoType):
+    __slots__ = ()
+
     def __init__(self, name, power_output):
         super().__init__(name, power_output)
         self._buff = Buff("PotatoPlantDebuff", 20, -self.power_output)
@@ -3,6 +3,8 @@ from data.things.thing import Thing
 
 
 class PotatoType(Thing):
+    __slots__ = ('base_power_output', '_power_output')
+
     def __init__(self, name, power_output):
         super().__init__(name, Predictor.predict_thing_cost(1, name), 1)
         self.base_power_output = power_output
@@ -19,7 +21,14 @@ class PotatoType(Thing):
 
     def buy(self):
         self.quantity += 1
-        return self._buff
+        return self._buff.copy() if self._buff is not None else None
+
+    def get_state(self):
+        return super().get_state() + (self._power_output,)
+
+    def set_state(self, state):
+        super().set_state(state[:-1])
+        self._power_output = state[-1]
 
     @property
     def multiplier(self):
@@ -30,6 +39,10 @@ class PotatoType(Thing):
         self._multiplier = value
         self.power_output = self.base_power_output * self._multiplier
 
+    # Cost of the next one when quantity are owned
+    def cost_at(self, quantity):
+        return Predictor.predict_thing_cost(quantity + 1, self.name)
+
     def _update_quantity(self):
-        self.current_cost = Predictor.predict_thing_cost(self._quantity + 1, self.name)
+        self.current_cost = self.cost_at(self._quantity)
         self._efficiency = self.power_output / self.current_cost
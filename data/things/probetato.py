@@ -1,9 +1,10 @@
-from analyse.predictor import Predictor
 from data.buff import Buff
 from data.things.potato_types import PotatoType
 
 
 class Probetato(PotatoType):
+    __slots__ = ()
+
     def __init__(self, name, power_output):
         super().__init__(name, power_output)
         self._efficiency = self._probetato_efficiency()
@@ -20,8 +21,12 @@ class Probetato(PotatoType):
     def power_output(self, value):
         self._power_output = value
 
+    def cost_at(self, quantity):
+        cost = super().cost_at(quantity)
+        if quantity == 3:
+            cost += 550
+        return cost
+
     def _update_quantity(self):
-        self.current_cost = Predictor.predict_thing_cost(self._quantity + 1, self.name)
-        if self._quantity == 3:
-            self.current_cost += 550
+        self.current_cost = self.cost_at(self._quantity)
         self._efficiency = self._probetato_efficiency()
@@ -2,6 +2,9 @@ from abc import abstractmethod, ABC
 
 
 class Thing(ABC):
+    # Fixed attributes, there are thousands of these copied around in every simulation
+    __slots__ = ('name', 'current_cost', '_efficiency', '_multiplier', '_quantity', '_buff')
+
     def __init__(self, name, cost, multiplier):
         self.name = name
         self.current_cost = cost
@@ -23,6 +26,10 @@ class Thing(ABC):
     def efficiency(self):
         return self._efficiency
 
+    @property
+    def buff(self):
+        return self._buff
+
     @property
     def quantity(self):
         return self._quantity
@@ -39,6 +46,13 @@ class Thing(ABC):
     def set_injection(self, thing_maker):
         pass
 
+    # Mutable part of the thing, restored at the start of every rollout
+    def get_state(self):
+        return self._quantity, self._multiplier, self.current_cost, self._efficiency
+
+    def set_state(self, state):
+        self._quantity, self._multiplier, self.current_cost, self._efficiency = state
+
     # Serialize in json
     def serialize(self):
         return {
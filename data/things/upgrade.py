@@ -2,6 +2,8 @@ from data.things.thing import Thing
 
 
 class Upgrade(Thing):
+    __slots__ = ('_target', '_target_obj', '_thing_maker')
+
     def __init__(self, name, target, multiplier, cost):
         super().__init__(name, cost, multiplier)
         self._multiplier = multiplier
@@ -16,10 +18,10 @@ class Upgrade(Thing):
         if self._target_obj:
             return self._target_obj
 
-        for thing in self._thing_maker.simulation_things:
-            if thing.name == self._target:
-                self._target_obj = thing
-                return thing
+        index = self._thing_maker.thing_index.get(self._target)
+        if index is not None:
+            self._target_obj = self._thing_maker.simulation_things[index]
+            return self._target_obj
 
     def buy(self):
         self.quantity = 1
@@ -46,6 +48,14 @@ class Upgrade(Thing):
     def buyable(self):
         return not self._quantity
 
+    @property
+    def target(self):
+        return self._target
+
+    @property
+    def multiplier(self):
+        return self._multiplier
+
     @property
     def thing_maker(self):
         return self._thing_maker
@@ -10,6 +10,8 @@ class SpacePlanner(tk.Tk):
     def __init__(self):
         super().__init__()
         self.running_simulation = False
+        # Results shown last, the server answers 304 while they didn't change
+        self.results_etag = None
 
         self.title("Space Planner")
         self.geometry("675x525")
@@ -82,10 +84,11 @@ class SpacePlanner(tk.Tk):
 
     def update_simulation_results(self):
         try:
-            response = requests.get(host + '/simulation/results')
+            response = requests.get(host + '/simulation/results', headers={"If-None-Match": self.results_etag or ""})
             response.raise_for_status()  # Raise exception for 4XX/5XX errors
 
             if response.status_code == 200:
+                self.results_etag = response.headers.get("ETag")
                 data = response.json()
                 best_log = data["best_log"]
 
@@ -1,19 +1,41 @@
+import heapq
+
+
 class BuffManager:
+    # Active buffs as (tick they run out at, value) in a heap, a tick only touches the ones running out
     def __init__(self):
-        self.buffs = []
+        self._tick = 0
+        self._expiries = []
 
     def add_buff(self, buff):
         if buff is None:
             return 0
-        self.buffs.append(buff)
+        heapq.heappush(self._expiries, (self._tick + buff.duration, buff.value))
         return buff.value
 
     def use(self):
-        total = 0
+        self._tick += 1
 
-        for buff in self.buffs:
-            total += buff.use()
-            if buff.duration == 0:
-                self.buffs.remove(buff)
+        total = 0
+        while self._expiries and self._expiries[0][0] <= self._tick:
+            total -= heapq.heappop(self._expiries)[1]
 
         return total
+
+    def next_expiry(self):
+        # Ticks until the next buff runs out
+        return self._expiries[0][0] - self._tick if self._expiries else None
+
+    def skip(self, ticks):
+        # Advance ticks that are known not to expire any buff
+        self._tick += ticks
+
+    def schedule(self):
+        # (ticks until expiry, income change) of every active buff
+        return [(expiry - self._tick, -value) for expiry, value in self._expiries]
+
+    def copy(self):
+        buff_manager = BuffManager()
+        buff_manager._tick = self._tick
+        buff_manager._expiries = list(self._expiries)
+        return buff_manager
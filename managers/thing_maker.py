@@ -1,5 +1,8 @@
 import json
-from copy import deepcopy
+
+from data.simulation_state import SimulationState
+from data.things.probetato import Probetato
+from data.things.upgrade import Upgrade
 
 
 class ThingMaker:
@@ -8,8 +11,22 @@ class ThingMaker:
     _save_file = 'resource/save/things.json'
 
     _simulation_things = []
+    # Position of every simulation thing by name
+    _thing_index = None
     shared_memory = None
 
+    _catalog = None
+    _catalog_state = None
+    _catalog_version = None
+
+    def __getstate__(self):
+        # Upgrades keep a reference to the maker, don't pickle the cached things or the shared memory along with it,
+        # the shared memory sets itself back when the things are read
+        state = self.__dict__.copy()
+        for key in ('_catalog', '_catalog_state', '_catalog_version', '_thing_index', 'shared_memory'):
+            state.pop(key, None)
+        return state
+
     @property
     def simulation_things(self):
         return self._simulation_things
@@ -17,6 +34,13 @@ class ThingMaker:
     @simulation_things.setter
     def simulation_things(self, value):
         self._simulation_things = value
+        self._thing_index = None
+
+    @property
+    def thing_index(self):
+        if self._thing_index is None:
+            self._thing_index = {thing.name: i for i, thing in enumerate(self._simulation_things)}
+        return self._thing_index
 
     def add_things(self, things):
         temp = self.shared_memory.things
@@ -26,13 +50,26 @@ class ThingMaker:
 
     def reset_simulation_things(self):
         try:
-            return deepcopy(self.shared_memory.things)
+            # Only read the things again when they changed, otherwise rewind the last copy
+            version = self.shared_memory.things_generation
+            if self._catalog is None or version != self._catalog_version:
+                self._catalog = self.shared_memory.things
+                self._catalog_state = SimulationState.capture(self._catalog)
+                self._catalog_version = version
+            else:
+                self._catalog_state.restore(self._catalog)
+
+            return self._catalog
         except Exception:
             return None
 
+    def forget_simulation_things(self):
+        # Read the things again on the next reset, their costs changed
+        self._catalog = None
+
     def save_thing_maker(self):
         things_json = {}
-        for thing in self.shared_memory.things:
+        for thing in self.shared_memory.catalog:
             things_json.update(thing.serialize())
 
         with open(self._save_file, 'w') as f:
@@ -56,26 +93,26 @@ class ThingMaker:
     def current_income(things):
         total = 0
         for thing in things:
-            if type(thing).__name__ == 'Upgrade':
+            if isinstance(thing, Upgrade):
                 continue
-            if thing.name == 'Probetato':
+            if isinstance(thing, Probetato):
                 total -= thing.power_output * min(thing.quantity, 3)
             total += thing.power_output * thing.quantity
         return total
 
     def buy_thing(self, name):
-        temp = self.shared_memory.things
-        for thing in temp:
-            if thing.name == name:
-                thing.buy()
-                self.shared_memory.things = temp
-                return True
+        index = self.shared_memory.thing_table.index.get(name)
+        if index is None:
+            return False
 
-        return False
+        temp = self.shared_memory.things
+        temp[index].buy()
+        self.shared_memory.things = temp
+        return True
 
     def get_buyable_things(self):
         things = []
-        for thing in self.shared_memory.things:
+        for thing in self.shared_memory.catalog:
             if thing.buyable:
                 things.append({"name": thing.name, "quantity": thing.quantity, "cost": thing.current_cost})
         return things
@@ -0,0 +1,20 @@
+import json
+
+import pytest
+
+from analyse.simulation import Simulation
+from managers.thing_maker import ThingMaker
+
+
+@pytest.fixture
+def simulation(tmp_path):
+    # Things of a mid-game save
+    save_file = tmp_path / "things.json"
+    save_file.write_text(json.dumps({"SolarPanel": 20, "Potato": 12, "Probetato": 2, "CleanSolarPanels": 1,
+                                     "SolarAmbience": 1}))
+
+    thing_maker = ThingMaker()
+    thing_maker._save_file = str(save_file)
+    simulation = Simulation(thing_maker, process_count=1, checkpoint_interval=None, sessions=2)
+    simulation.sessions[0].load_things()
+    return simulation
@@ -0,0 +1,110 @@
+import random
+
+from data.buff import Buff
+from managers.buff_manager import BuffManager
+
+
+class ListBuffManager:
+    # The list the heap replaced, every tick counting down every buff
+    def __init__(self):
+        self.buffs = []
+
+    def add_buff(self, buff):
+        if buff is None:
+            return 0
+        self.buffs.append([buff.duration, buff.value])
+        return buff.value
+
+    def use(self):
+        total = 0
+        for buff in list(self.buffs):
+            buff[0] -= 1
+            if buff[0] == 0:
+                total -= buff[1]
+                self.buffs.remove(buff)
+        return total
+
+    def next_expiry(self):
+        return min((duration for duration, _ in self.buffs), default=None)
+
+    def skip(self, ticks):
+        for buff in self.buffs:
+            buff[0] -= ticks
+
+    def schedule(self):
+        return [(duration, -value) for duration, value in self.buffs]
+
+
+def test_use_runs_out_after_duration():
+    buff_manager = BuffManager()
+    assert buff_manager.add_buff(Buff("ProbetatoBuff", 3, 5)) == 5
+    assert buff_manager.add_buff(None) == 0
+
+    assert [buff_manager.use() for _ in range(4)] == [0, 0, -5, 0]
+    assert buff_manager.next_expiry() is None
+
+
+def test_same_expiry_runs_out_together():
+    buff_manager = BuffManager()
+    buff_manager.add_buff(Buff("ProbetatoBuff", 2, 5))
+    buff_manager.add_buff(Buff("PotatoPlantDebuff", 2, -3))
+    buff_manager.add_buff(Buff("ProbetatoBuff", 2, 1))
+
+    assert buff_manager.next_expiry() == 2
+    assert buff_manager.use() == 0
+    assert buff_manager.use() == -3
+    assert buff_manager.schedule() == []
+
+
+def test_skip_across_several_expiries():
+    buff_manager = BuffManager()
+    for duration, value in ((27, 4), (20, -2), (27, 1), (50, 3)):
+        buff_manager.add_buff(Buff("Buff", duration, value))
+
+    changes = []
+    while buff_manager.next_expiry() is not None:
+        buff_manager.skip(buff_manager.next_expiry() - 1)
+        changes.append(buff_manager.use())
+
+    assert changes == [2, -5, -3]
+
+
+def test_skipped_expiry_runs_out_on_next_use():
+    buff_manager = BuffManager()
+    buff_manager.add_buff(Buff("ProbetatoBuff", 3, 5))
+    buff_manager.add_buff(Buff("ProbetatoBuff", 4, 1))
+
+    buff_manager.skip(5)
+    assert buff_manager.use() == -6
+
+
+def test_copy_is_independent():
+    buff_manager = BuffManager()
+    buff_manager.add_buff(Buff("ProbetatoBuff", 2, 5))
+    copy = buff_manager.copy()
+
+    buff_manager.use()
+    assert copy.next_expiry() == 2
+    assert buff_manager.next_expiry() == 1
+
+
+def test_matches_list_manager():
+    rng = random.Random(7)
+    for _ in range(50):
+        heap, reference = BuffManager(), ListBuffManager()
+
+        for _ in range(300):
+            if rng.random() < 0.3:
+                buff = Buff("Buff", rng.choice((1, 2, 20, 27)), rng.choice((-3, 1, 5)))
+                assert heap.add_buff(buff) == reference.add_buff(buff)
+
+            next_expiry = heap.next_expiry()
+            assert next_expiry == reference.next_expiry()
+            if next_expiry is not None and next_expiry > 1 and rng.random() < 0.3:
+                # Never past a buff, like the event rollout
+                ticks = rng.randint(1, next_expiry - 1)
+                heap.skip(ticks)
+                reference.skip(ticks)
+
+            assert heap.use() == reference.use()
+            assert sorted(heap.schedule()) == sorted(reference.schedule())
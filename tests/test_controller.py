@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+import controller.controller as controller
+from analyse.remote_workers import Coordinator
+
+
+@pytest.fixture
+def client(simulation, monkeypatch):
+    monkeypatch.setattr(controller, "simulation", simulation)
+    monkeypatch.setattr(controller, "coordinator", Coordinator(simulation))
+    monkeypatch.setattr(controller, "results_snapshots", {})
+    yield controller.flask_app.test_client()
+    for snapshot in controller.results_snapshots.values():
+        snapshot.close()
+    simulation.shutdown()
+
+
+def test_idle_results_keep_their_etag(client, simulation):
+    assert client.post('/simulation/start', json={"time_steps": 100}).status_code == 200
+    deadline = time.monotonic() + 30
+    while not sum(simulation.shared_memory.simulation_index):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    client.post('/simulation/end')
+
+    etag = client.get('/simulation/results').headers["ETag"]
+    time.sleep(0.6)
+    response = client.get('/simulation/results', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    start = time.monotonic()
+    response = client.get('/simulation/results/poll?timeout=1', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert time.monotonic() - start >= 0.9
@@ -0,0 +1,26 @@
+import math
+import random
+import statistics
+
+import pytest
+
+
+def final_incomes(simulation, run_rollout, rollouts):
+    random.seed(1)
+    incomes = []
+    for _ in range(rollouts):
+        simulation_things = simulation.thing_maker.reset_simulation_things()
+        incomes.append(run_rollout(simulation_things)[0])
+    return incomes
+
+
+@pytest.mark.parametrize("time_steps, rollouts", [(900, 300), (3600, 100)])
+def test_event_rollout_matches_step_rollout(simulation, time_steps, rollouts):
+    # The waits between purchases are drawn at once instead of second by second, the final incomes follow the same
+    # distribution
+    simulation.time_steps = time_steps
+    step = final_incomes(simulation, simulation.run_rollout, rollouts)
+    event = final_incomes(simulation, simulation.run_event_rollout, rollouts)
+
+    standard_error = math.hypot(statistics.stdev(step), statistics.stdev(event)) / math.sqrt(rollouts)
+    assert abs(statistics.mean(step) - statistics.mean(event)) < 4 * standard_error
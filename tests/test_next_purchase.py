@@ -0,0 +1,30 @@
+import time
+
+from analyse.next_purchase import NextPurchase
+
+
+def test_one_first_purchase_scored_has_no_confidence(simulation):
+    next_purchase = NextPurchase(simulation.shared_memory.things, 14400, breadth=1, max_depth=1)
+    assert len(next_purchase.greedy(next_purchase.initial_state)) > 1
+
+    suggestion = next_purchase.suggest(time.monotonic() + 60)
+    assert suggestion["source"] == "lookahead"
+    assert suggestion["visits"] == 1
+    assert suggestion["confidence"] is None
+
+
+def test_confidence_is_margin_over_next_best(simulation):
+    next_purchase = NextPurchase(simulation.shared_memory.things, 900, max_depth=1)
+    suggestion = next_purchase.suggest(time.monotonic() + 60)
+
+    incomes = sorted(next_purchase._incomes.values(), reverse=True)
+    assert len(incomes) > 1
+    assert suggestion["income"] == incomes[0]
+    assert suggestion["confidence"] == (incomes[0] - incomes[1]) / incomes[0]
+
+
+def test_passed_deadline_answers_greedy(simulation):
+    suggestion = NextPurchase(simulation.shared_memory.things, 900).suggest(time.monotonic())
+    assert suggestion["source"] == "greedy"
+    assert suggestion["depth"] == 0
+    assert suggestion["confidence"] is None
@@ -0,0 +1,127 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from analyse.simulation import Simulation
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_evaluate_keeps_branch_and_bound(simulation):
+    # The worker loop in a thread of this process, to look at its search
+    connection, worker_connection = multiprocessing.Pipe()
+    worker = threading.Thread(target=simulation.run_simulation, args=(0, worker_connection))
+    worker.start()
+    try:
+        connection.send(("start", {
+            "run": 1, "session": 0, "start_income": None, "time_steps": 900, "engine": Simulation.STEP_ENGINE,
+            "planner": Simulation.BRANCH_AND_BOUND_PLANNER, "adaptive": False, "lead": True
+        }))
+        wait_for(lambda: simulation._branch_and_bound is not None and simulation._branch_and_bound.nodes >= 400)
+
+        branch_and_bound = simulation._branch_and_bound
+        nodes = branch_and_bound.nodes
+        upper_bound = simulation.shared_memory.upper_bound
+
+        connection.send(("evaluate", {"session": 0, "plans": [[(0, None), (1, None)]], "time_steps": 900,
+                                      "log": False}))
+        results = connection.recv()
+        assert results[0]["complete"]
+
+        wait_for(lambda: branch_and_bound.nodes > nodes)
+        assert simulation._branch_and_bound is branch_and_bound
+        assert simulation.shared_memory.upper_bound <= upper_bound
+    finally:
+        connection.send(("stop", None))
+        worker.join()
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def test_assign_keeps_workers_on_their_session(simulation):
+    simulation.switch_gap = 10
+    simulation._connections = [RecordingConnection() for _ in range(3)]
+    simulation._assignment = [None] * 3
+
+    sessions = simulation.sessions[:2]
+    for run, session in enumerate(sessions):
+        session.running_simulation = True
+        session.configuration = {"run": run, "session": session.slot}
+
+    def schedule(seconds):
+        for _ in range(seconds):
+            simulation._assigned_at -= 1
+            simulation._assign()
+
+    schedule(1)
+    assert sorted(session.workers for session in sessions) == [1, 2]
+    leads = [i for i, (_, lead) in enumerate(simulation._assignment) if lead]
+
+    # The spare worker only moves once its session is switch_gap worker seconds ahead
+    schedule(8)
+    assert sum(len(connection.sent) for connection in simulation._connections) == 3
+
+    schedule(30)
+    moves = sum(len(connection.sent) for connection in simulation._connections) - 3
+    assert 1 <= moves <= 2
+    assert [i for i, (_, lead) in enumerate(simulation._assignment) if lead] == leads
+    assert abs(sessions[0].service - sessions[1].service) <= simulation.switch_gap + 2
+
+
+def test_concurrent_starts_fork_one_pool(simulation):
+    simulation.open_session("alpha")
+    starts = [threading.Thread(target=simulation.start_simulation, args=(None, 300), kwargs={"session": slot})
+              for slot in (0, 1)]
+    try:
+        for start in starts:
+            start.start()
+        for start in starts:
+            start.join()
+
+        assert len(simulation.processes) == len(simulation._connections) == simulation.process_count
+        assert len({session.configuration["run"] for session in simulation.sessions}) == 2
+    finally:
+        simulation.shutdown()
+
+
+class FakeConnection:
+    def __init__(self, replies):
+        self.replies = list(replies)
+
+    def send(self, command):
+        pass
+
+    def poll(self, timeout):
+        return bool(self.replies)
+
+    def recv(self):
+        return self.replies.pop(0)
+
+
+def test_evaluate_reads_every_reply_before_raising(simulation, monkeypatch):
+    # One worker fails, one answers, one hangs
+    connections = [FakeConnection([None]), FakeConnection([[{"income": 1.0}]]), FakeConnection([])]
+    simulation.processes = [None] * len(connections)
+    simulation._connections = connections
+    simulation._assignment = [None] * len(connections)
+    replaced = []
+    monkeypatch.setattr(simulation, "_replace_worker", replaced.append)
+
+    with pytest.raises(RuntimeError):
+        simulation.evaluate([[], [], []], 300, timeout=0.1)
+
+    assert not any(connection.replies for connection in connections)
+    assert replaced == [2]